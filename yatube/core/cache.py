@@ -0,0 +1,252 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Не чаще раза в секунду обновляем время обращения к ключу:
+# для LRU такой точности хватает, а чтение не превращается в запись.
+ACCESS_PRECISION = 1.0
+
+# Ограничение SQLite на число параметров в одном запросе.
+MAX_PARAMS = 500
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed_idx ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires_idx ON cache (expires)',
+)
+
+UPSERT = (
+    'INSERT INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?) '
+    'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+    'expires = excluded.expires, accessed = excluded.accessed'
+)
+
+NOT_EXPIRED = '(expires IS NULL OR expires > ?)'
+
+
+def _chunks(items, size=MAX_PARAMS):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SQLiteCache(BaseCache):
+    """
+    Кэш в файле SQLite, общий для всех процессов на одном сервере.
+    Целые числа хранятся как INTEGER, поэтому incr выполняется одним
+    UPDATE внутри транзакции и не теряет приращения при гонке
+    процессов. Сверх MAX_ENTRIES вытесняются давно не читавшиеся ключи.
+    """
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = os.path.abspath(location)
+        options = params.get('OPTIONS', {})
+        self._busy_timeout = options.get('BUSY_TIMEOUT', 5)
+        self._local = threading.local()
+
+    @property
+    def _connection(self):
+        # Соединение своё у каждого потока и процесса: после fork
+        # унаследованное соединение SQLite использовать нельзя.
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            self._local.connection = self._connect()
+            self._local.pid = pid
+        return self._local.connection
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        connection = sqlite3.connect(
+            self._path, timeout=self._busy_timeout, isolation_level=None,
+            check_same_thread=False,
+        )
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute('PRAGMA synchronous = NORMAL')
+        for statement in SCHEMA:
+            connection.execute(statement)
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE сразу берёт блокировку на запись, чтобы
+        # чтение и запись внутри транзакции не перемежались с другими.
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _encode(self, value):
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def _decode(self, value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _touch_accessed(self, keys, now):
+        for chunk in _chunks(keys):
+            self._connection.execute(
+                f'UPDATE cache SET accessed = ? '
+                f'WHERE key IN ({", ".join("?" * len(chunk))})',
+                [now, *chunk],
+            )
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        row = self._connection.execute(
+            f'SELECT value, accessed FROM cache WHERE key = ? '
+            f'AND {NOT_EXPIRED}',
+            (key, now),
+        ).fetchone()
+        if row is None:
+            return default
+        value, accessed = row
+        if now - accessed > ACCESS_PRECISION:
+            self._touch_accessed([key], now)
+        return self._decode(value)
+
+    def get_many(self, keys, version=None):
+        keys_map = {self._key(key, version): key for key in keys}
+        if not keys_map:
+            return {}
+        now = time.time()
+        found = {}
+        stale = []
+        for chunk in _chunks(list(keys_map)):
+            rows = self._connection.execute(
+                f'SELECT key, value, accessed FROM cache '
+                f'WHERE key IN ({", ".join("?" * len(chunk))}) '
+                f'AND {NOT_EXPIRED}',
+                [*chunk, now],
+            )
+            for key, value, accessed in rows:
+                found[keys_map[key]] = self._decode(value)
+                if now - accessed > ACCESS_PRECISION:
+                    stale.append(key)
+        if stale:
+            self._touch_accessed(stale, now)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        expires = self.get_backend_timeout(timeout)
+        with self._transaction() as connection:
+            connection.execute(
+                UPSERT, (key, self._encode(value), expires, time.time()))
+            self._cull(connection)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = [(self._key(key, version), self._encode(value), expires, now)
+                for key, value in data.items()]
+        with self._transaction() as connection:
+            connection.executemany(UPSERT, rows)
+            self._cull(connection)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                f'{UPSERT} WHERE NOT {NOT_EXPIRED}',
+                (key, self._encode(value), expires, now, now),
+            )
+            added = cursor.rowcount == 1
+            if added:
+                self._cull(connection)
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                f'UPDATE cache SET value = value + ?, accessed = ? '
+                f"WHERE key = ? AND typeof(value) = 'integer' "
+                f'AND {NOT_EXPIRED}',
+                (delta, now, key, now),
+            )
+            if cursor.rowcount != 1:
+                raise ValueError("Key '%s' not found" % key)
+            return connection.execute(
+                'SELECT value FROM cache WHERE key = ?', (key,),
+            ).fetchone()[0]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        cursor = self._connection.execute(
+            f'UPDATE cache SET expires = ?, accessed = ? '
+            f'WHERE key = ? AND {NOT_EXPIRED}',
+            (self.get_backend_timeout(timeout), now, key, now),
+        )
+        return cursor.rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        row = self._connection.execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {NOT_EXPIRED}',
+            (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        cursor = self._connection.execute(
+            'DELETE FROM cache WHERE key = ?', (key,))
+        return cursor.rowcount == 1
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        with self._transaction() as connection:
+            for chunk in _chunks(keys):
+                connection.execute(
+                    f'DELETE FROM cache '
+                    f'WHERE key IN ({", ".join("?" * len(chunk))})',
+                    chunk,
+                )
+
+    def clear(self):
+        self._connection.execute('DELETE FROM cache')
+
+    def _cull(self, connection):
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache')
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE key IN ('
+            ' SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+            (count // self._cull_frequency,),
+        )
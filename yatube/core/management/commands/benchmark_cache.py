@@ -0,0 +1,79 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache import SQLiteCache
+
+COUNTER = 'benchmark:counter'
+
+
+def _increment(backend, times):
+    for _ in range(times):
+        backend.incr(COUNTER)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает скорость операций и общий доступ из нескольких '
+        'процессов для LocMem, файлового кэша и кэша в SQLite.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keys', type=int, default=1000)
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--increments', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            params = {'OPTIONS': {'MAX_ENTRIES': options['keys'] * 2}}
+            backends = {
+                'LocMem': LocMemCache('benchmark', params),
+                'Файлы': FileBasedCache(
+                    os.path.join(directory, 'files'), params),
+                'SQLite': SQLiteCache(
+                    os.path.join(directory, 'cache.sqlite3'), params),
+            }
+            for name, backend in backends.items():
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                self.report(backend, options['keys'])
+                self.shared(backend, options['processes'],
+                            options['increments'])
+
+    def report(self, backend, count):
+        keys = [f'benchmark:{i}' for i in range(count)]
+        value = {'text': 'x' * 200, 'items': list(range(20))}
+        operations = {
+            'set': lambda key: backend.set(key, value),
+            'get': backend.get,
+            'get_many по 10': lambda key: backend.get_many(keys[:10]),
+            'add существующего': lambda key: backend.add(key, value),
+        }
+        for name, operation in operations.items():
+            started = time.perf_counter()
+            for key in keys:
+                operation(key)
+            elapsed = (time.perf_counter() - started) / count * 10 ** 6
+            self.stdout.write(f'{name}: {elapsed:.1f} мкс')
+
+    def shared(self, backend, processes, increments):
+        # Каждый процесс увеличивает общий счётчик: в общем кэше с
+        # атомарным incr итог равен сумме всех приращений.
+        backend.set(COUNTER, 0)
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=_increment, args=(backend, increments))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        expected = processes * increments
+        self.stdout.write(
+            f'incr из {processes} процессов: '
+            f'{backend.get(COUNTER)} из {expected}')
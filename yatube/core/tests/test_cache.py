@@ -0,0 +1,60 @@
+import os
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from ..cache import SQLiteCache
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def make_cache(self, max_entries=300):
+        return SQLiteCache(
+            self.path, {'OPTIONS': {'MAX_ENTRIES': max_entries}})
+
+    def test_values_shared_between_instances(self):
+        """Запись одного экземпляра видна другому на том же файле."""
+        self.cache.set('key', {'value': [1, 2]})
+        self.assertEqual(self.make_cache().get('key'), {'value': [1, 2]})
+        self.assertEqual(
+            self.make_cache().get_many(['key', 'missing']),
+            {'key': {'value': [1, 2]}},
+        )
+
+    def test_incr(self):
+        """incr атомарно меняет число и падает на отсутствующем ключе."""
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter', 5), 6)
+        self.assertEqual(self.make_cache().decr('counter'), 5)
+        self.assertIs(self.cache.get('counter'), 5)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_add_and_expiry(self):
+        """add не перезаписывает живой ключ, но занимает истёкший."""
+        self.assertTrue(self.cache.add('key', 'first'))
+        self.assertFalse(self.cache.add('key', 'second'))
+        self.cache.set('key', 'old', 0.01)
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'new'))
+        self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_lru_eviction(self):
+        """Сверх MAX_ENTRIES вытесняются давно не читавшиеся ключи."""
+        cache = self.make_cache(max_entries=3)
+        for number in range(3):
+            cache.set(f'key{number}', number)
+        cache._connection.execute('UPDATE cache SET accessed = 0')
+        cache.get('key0')
+        cache.set('key3', 3)
+        self.assertEqual(cache.get('key0'), 0)
+        self.assertEqual(cache.get('key3'), 3)
+        self.assertEqual(len(cache.get_many(
+            ['key0', 'key1', 'key2', 'key3'])), 3)
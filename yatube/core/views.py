@@ -14,7 +14,7 @@ def Not_found_404(request, exception):
     )
 
 
-def crfs_403(request):
+def crfs_403(request, exception=None):
     return render(request, 'error_page/403.html', status=HTTPStatus.FORBIDDEN)
 
 
@@ -1,10 +1,90 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.paginator import Paginator
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
 
+from . import search
 from .models import Group, Post, Comment, Follow
 
+User = get_user_model()
+
+
+def username_prefix(prefix):
+    """
+    id пользователей, чьё имя начинается с prefix. Диапазон по
+    уникальному индексу username вместо LIKE, который SQLite
+    выполняет перебором.
+    """
+    return User.objects.filter(
+        username__gte=prefix, username__lt=prefix + '\U0010ffff',
+    ).values('pk')
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Для списка без фильтров по большой таблице вместо COUNT(*)
+    берёт максимальный id, как и счётчик постов на главной.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = queryset.model.objects.aggregate(
+                Max('pk'))['pk__max'] or 0
+            if estimate > settings.POSTS_COUNT_ESTIMATE_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class InputFilter(admin.SimpleListFilter):
+    """Фильтр с полем ввода вместо списка всех возможных значений."""
+
+    template = 'admin/input_filter.html'
+
+    def lookups(self, request, model_admin):
+        # Непустой список нужен, чтобы фильтр показывался.
+        return ((None, None),)
+
+    def choices(self, changelist):
+        all_choice = next(super().choices(changelist))
+        all_choice['query_parts'] = (
+            (key, value)
+            for key, value in changelist.get_filters_params().items()
+            if key != self.parameter_name
+        )
+        yield all_choice
+
+
+class AuthorFilter(InputFilter):
+    title = 'автору'
+    parameter_name = 'author'
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(author__username=self.value())
+
+
+class UserFilter(InputFilter):
+    title = 'подписчику'
+    parameter_name = 'user'
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(user__username=self.value())
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """Список без полного COUNT(*) и без подсчёта всех записей."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(ScalableAdmin):
     """
     Перечисляем поля, которые должны
     отображаться в админке.
@@ -18,10 +98,33 @@ class PostAdmin(admin.ModelAdmin):
         'group'
     )
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
+    autocomplete_fields = ('author',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет по полнотекстовому индексу вместо LIKE по всей таблице."""
+        if not search.available() or not search.match_query(search_term):
+            return super().get_search_results(
+                request, queryset, search_term)
+        return search.filter_matching(queryset, search_term), False
+
+    def get_changelist_formset(self, request, **kwargs):
+        """Список групп для list_editable читается один раз на страницу."""
+        formset = super().get_changelist_formset(request, **kwargs)
+        choices = list(formset.form.base_fields['group'].choices)
+
+        class CachedChoicesFormSet(formset):
+            def _construct_form(self, i, **kwargs):
+                form = super()._construct_form(i, **kwargs)
+                form.fields['group'].choices = choices
+                return form
+
+        return CachedChoicesFormSet
+
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
@@ -31,17 +134,40 @@ class GroupAdmin(admin.ModelAdmin):
         'slug',
         'description'
     )
+    search_fields = ('title', 'slug')
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(ScalableAdmin):
     list_display = ('pk', 'post', 'author', 'text', 'created')
-    list_filter = ('author',)
-    search_fields = ('author', 'created')
+    list_select_related = ('post', 'author')
+    list_filter = (AuthorFilter,)
+    search_fields = ('author__username', 'text')
+    autocomplete_fields = ('post', 'author')
+
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет по началу имени автора и по тексту через индексы."""
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        found = queryset.filter(author__in=username_prefix(term))
+        if search.available() and search.match_query(term):
+            found |= search.filter_matching(queryset, term)
+        return found, False
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(ScalableAdmin):
     list_display = ('pk', 'user', 'author')
-    list_filter = ('author',)
-    search_fields = ('author', 'user')
+    list_select_related = ('user', 'author')
+    list_filter = (UserFilter, AuthorFilter)
+    search_fields = ('user__username', 'author__username')
+    autocomplete_fields = ('user', 'author')
+
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет по началу имени подписчика или автора."""
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        users = username_prefix(term)
+        return queryset.filter(Q(user__in=users) | Q(author__in=users)), False
@@ -0,0 +1,224 @@
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_safe
+
+from .cache import anonymous_page_cache
+from .models import Comment, Group, Post, Timeline
+from .timeline import pulled_authors
+from .utils import NEXT, decode_cursor, encode_key, seek_queryset
+
+User = get_user_model()
+
+
+def _image_url(name):
+    return default_storage.url(name) if name else None
+
+
+# Поле ответа: (поле для values(), преобразование значения или None).
+POST_FIELDS = {
+    'id': ('id', None),
+    'text': ('text', None),
+    'pub_date': ('pub_date', None),
+    'author': ('author__username', None),
+    'group': ('group__slug', None),
+    'image': ('image', _image_url),
+    'comments_count': ('comments_count', None),
+}
+COMMENT_FIELDS = {
+    'id': ('id', None),
+    'post': ('post_id', None),
+    'author': ('author__username', None),
+    'text': ('text', None),
+    'created': ('created', None),
+}
+GROUP_FIELDS = {
+    name: (name, None)
+    for name in ('id', 'title', 'slug', 'description', 'posts_count')
+}
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def api_view(view):
+    """JSON из словаря, который вернуло представление, и ошибки в JSON."""
+    @require_safe
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return JsonResponse(view(request, *args, **kwargs))
+        except Http404:
+            return JsonResponse({'error': 'Не найдено'}, status=404)
+        except ApiError as error:
+            return JsonResponse({'error': str(error)}, status=error.status)
+    return wrapper
+
+
+class Page:
+    """Разобранные параметры fields, limit и cursor одного запроса."""
+
+    def __init__(self, request, available, date_field='pub_date'):
+        self.available = available
+        self.date_field = date_field
+        self.names = self._names(request.GET.get('fields'))
+        self.limit = self._limit(request.GET.get('limit'))
+        self.key = self._key(request.GET.get('cursor'))
+
+    def _names(self, requested):
+        if not requested:
+            return list(self.available)
+        names = [name.strip() for name in requested.split(',')
+                 if name.strip()]
+        unknown = sorted(set(names) - set(self.available))
+        if unknown:
+            raise ApiError(f'Неизвестные поля: {", ".join(unknown)}')
+        return names
+
+    def _limit(self, value):
+        if value is None:
+            return settings.POSTS_LIMIT
+        try:
+            return max(1, min(int(value), settings.API_MAX_LIMIT))
+        except ValueError:
+            raise ApiError('limit должен быть числом')
+
+    def _key(self, token):
+        if not token:
+            return None
+        cursor = decode_cursor(token)
+        if cursor is None or cursor[0] != NEXT:
+            raise ApiError('Неверный курсор')
+        return cursor[1]
+
+    @property
+    def lookups(self):
+        # Ключ курсора читается всегда, даже если его нет в fields.
+        return {self.available[name][0] for name in self.names} | {
+            self.date_field, 'id'}
+
+    def row(self, values):
+        data = {}
+        for name in self.names:
+            lookup, convert = self.available[name]
+            value = values[lookup]
+            data[name] = convert(value) if convert else value
+        return data
+
+    def result(self, rows):
+        """Ответ по limit + 1 строкам: лишняя говорит о следующей странице."""
+        next_cursor = None
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            last = rows[-1]
+            next_cursor = encode_key(NEXT, (last[self.date_field], last['id']))
+        return {'results': [self.row(values) for values in rows],
+                'next': next_cursor}
+
+    def seek(self, queryset):
+        """Одна keyset-выборка по индексу (дата, id) без моделей."""
+        return self.result(seek_queryset(
+            queryset.values(*self.lookups), self.key, False, self.limit + 1,
+            date_field=self.date_field, id_field='id',
+        ))
+
+
+def _pk(queryset, **lookup):
+    pk = queryset.filter(**lookup).values_list('pk', flat=True).first()
+    if pk is None:
+        raise Http404
+    return pk
+
+
+@anonymous_page_cache
+@api_view
+def posts(request):
+    return Page(request, POST_FIELDS).seek(Post.objects.all())
+
+
+@anonymous_page_cache
+@api_view
+def post(request, post_id):
+    page = Page(request, POST_FIELDS)
+    values = Post.objects.filter(pk=post_id).values(*page.lookups).first()
+    if values is None:
+        raise Http404
+    return page.row(values)
+
+
+@anonymous_page_cache
+@api_view
+def post_comments(request, post_id):
+    page = Page(request, COMMENT_FIELDS, date_field='created')
+    post_id = _pk(Post.objects, pk=post_id)
+    return page.seek(Comment.objects.filter(post_id=post_id))
+
+
+@anonymous_page_cache
+@api_view
+def groups(request):
+    # Групп немного, поэтому они отдаются одним списком.
+    page = Page(request, GROUP_FIELDS)
+    rows = Group.objects.order_by('title').values(
+        *{GROUP_FIELDS[name][0] for name in page.names})
+    return {'results': [page.row(values) for values in rows], 'next': None}
+
+
+@anonymous_page_cache
+@api_view
+def group_posts(request, slug):
+    page = Page(request, POST_FIELDS)
+    group_id = _pk(Group.objects, slug=slug)
+    return page.seek(Post.objects.filter(group_id=group_id))
+
+
+@anonymous_page_cache
+@api_view
+def author_posts(request, username):
+    page = Page(request, POST_FIELDS)
+    author_id = _pk(User.objects, username=username)
+    return page.seek(Post.objects.filter(author_id=author_id))
+
+
+def _feed_keys(user, page):
+    # Та же гибридная лента, что follow_feed: ключи (pub_date, id)
+    # из timeline и из постов популярных авторов сливаются, а сами
+    # посты читаются одним запросом.
+    limit = page.limit + 1
+    pulled = pulled_authors(user)
+    entries = Timeline.objects.filter(user=user)
+    if pulled:
+        entries = entries.exclude(author_id__in=pulled)
+    keys = [
+        (row['pub_date'], row['post_id']) for row in seek_queryset(
+            entries.values('pub_date', 'post_id'), page.key, False, limit,
+            id_field='post_id')
+    ]
+    if pulled:
+        posts = Post.objects.filter(author_id__in=pulled)
+        keys += [
+            (row['pub_date'], row['id']) for row in seek_queryset(
+                posts.values('pub_date', 'id'), page.key, False, limit,
+                id_field='id')
+        ]
+        keys = sorted(keys, reverse=True)[:limit]
+    return keys
+
+
+@api_view
+def follow(request):
+    if not request.user.is_authenticated:
+        raise ApiError('Нужна авторизация', status=401)
+    page = Page(request, POST_FIELDS)
+    keys = _feed_keys(request.user, page)
+    found = {
+        values['id']: values for values in Post.objects.filter(
+            pk__in=[pk for _, pk in keys]).order_by().values(*page.lookups)
+    }
+    return page.result([found[pk] for _, pk in keys if pk in found])
@@ -0,0 +1,43 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _log_error(future):
+    error = future.exception()
+    if error is not None:
+        logger.error('Фоновая задача завершилась ошибкой', exc_info=error)
+
+
+def submit(func, *args):
+    """
+    Выполняет func(*args) в пуле процессов вне запроса. При
+    BACKGROUND_WORKERS = 0 функция выполняется сразу в текущем процессе.
+    """
+    global _executor
+    if not settings.BACKGROUND_WORKERS:
+        func(*args)
+        return
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            settings.BACKGROUND_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            # Модули с моделями импортируются в процессе только после
+            # настройки Django.
+            initializer=django.setup,
+        )
+    try:
+        _executor.submit(func, *args).add_done_callback(_log_error)
+    except BrokenProcessPool:
+        # Пул пересоздаётся при следующей задаче; потерянное можно
+        # восстановить командами generate_thumbnails и rebuild_timelines.
+        logger.exception('Пул фоновых задач недоступен')
+        _executor = None
@@ -0,0 +1,213 @@
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+FEED = 'feed'
+# Шаг опроса кэша при ожидании чужого пересчёта, в секундах.
+WAIT_STEP = 0.05
+
+
+def _version_key(scope):
+    return f'posts:version:{scope}'
+
+
+def _modified_key(scope):
+    return f'posts:modified:{scope}'
+
+
+def _initial_version():
+    # Версия после вытеснения ключа не должна совпасть со старой,
+    # иначе снова станут видны устаревшие фрагменты.
+    return int(time.time() * 1000)
+
+
+def get_version(scope=FEED):
+    """Текущая версия содержимого лент, входит в ключи фрагментов."""
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(scope=FEED):
+    """Инвалидирует все закэшированные фрагменты лент разом."""
+    key = _version_key(scope)
+    cache.set(_modified_key(scope), int(time.time()), None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = _initial_version()
+        cache.set(key, version, None)
+        return version
+
+
+def get_last_modified(scope=FEED):
+    """Время последнего изменения содержимого лент."""
+    key = _modified_key(scope)
+    modified = cache.get(key)
+    if modified is None:
+        cache.add(key, int(time.time()), None)
+        modified = cache.get(key)
+    return modified
+
+
+class _Stats:
+    """
+    Счётчики попаданий копятся в памяти процесса и сбрасываются в кэш
+    не чаще раза в FEED_CACHE_STATS_INTERVAL секунд: запись в кэш на
+    каждое попадание выстраивала бы все процессы в очередь за
+    блокировкой файла кэша.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = Counter()
+        self.flushed = time.monotonic()
+
+    def add(self, name):
+        with self.lock:
+            self.pending[name] += 1
+            due = (time.monotonic() - self.flushed
+                   >= settings.FEED_CACHE_STATS_INTERVAL)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, Counter()
+            self.flushed = time.monotonic()
+        for name, count in pending.items():
+            key = f'posts:cache:{name}'
+            if not cache.add(key, count, None):
+                try:
+                    cache.incr(key, count)
+                except ValueError:
+                    cache.set(key, count, None)
+
+
+_stats = _Stats()
+
+
+def _stat(name):
+    _stats.add(name)
+
+
+def flush_stats():
+    """Сбрасывает в кэш накопленные этим процессом счётчики."""
+    _stats.flush()
+
+
+def cache_stats():
+    """Счётчики попаданий, промахов и отдачи устаревших значений."""
+    flush_stats()
+    names = ('hit', 'miss', 'stale')
+    values = cache.get_many([f'posts:cache:{name}' for name in names])
+    return {name: values.get(f'posts:cache:{name}', 0) for name in names}
+
+
+def _is_fresh(entry, version):
+    _, entry_version, delta, expiry = entry
+    if entry_version != version:
+        return False
+    # Вероятностное раннее обновление (XFetch): чем ближе срок и чем
+    # дольше пересчёт, тем выше шанс обновить значение заранее.
+    early = delta * settings.FEED_CACHE_EARLY_REFRESH * -math.log(
+        random.random() or 1e-12)
+    return time.time() + early < expiry
+
+
+def _wait_for(key):
+    # Значения ещё нет, а пересчитывает другой запрос: ждём его результат
+    # не дольше FEED_CACHE_LOCK_WAIT секунд.
+    deadline = time.monotonic() + settings.FEED_CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def get_or_compute(key, compute, timeout, version=None):
+    """
+    Значение из кэша с защитой от одновременного пересчёта. Пересчитывает
+    только тот, кто взял блокировку; остальные в это время получают
+    устаревшее значение, а если его нет — ждут результата. Смена
+    version делает запись устаревшей.
+    """
+    entry = cache.get(key)
+    lock_key = f'{key}:lock'
+    if entry is not None:
+        if _is_fresh(entry, version):
+            _stat('hit')
+            return entry[0]
+        if not cache.add(lock_key, 1, settings.FEED_CACHE_LOCK_TIMEOUT):
+            _stat('stale')
+            return entry[0]
+        locked = True
+    else:
+        locked = cache.add(lock_key, 1, settings.FEED_CACHE_LOCK_TIMEOUT)
+        if not locked:
+            entry = _wait_for(key)
+            if entry is not None:
+                _stat('hit')
+                return entry[0]
+    _stat('miss')
+    try:
+        started = time.time()
+        value = compute()
+        finished = time.time()
+        cache.set(
+            key,
+            (value, version, finished - started, finished + timeout),
+            timeout + settings.FEED_CACHE_STALE_TIMEOUT,
+        )
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return value
+
+
+def anonymous_page_cache(view):
+    """
+    Кэширует страницу целиком для гостей. ETag и Last-Modified
+    строятся по версии содержимого, поэтому на If-None-Match и
+    If-Modified-Since ответ 304 отдаётся без обращения к базе.
+    Смена версии при изменении данных сбрасывает все страницы.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (request.method not in ('GET', 'HEAD')
+                or request.user.is_authenticated):
+            return view(request, *args, **kwargs)
+        version = get_version()
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        etag = quote_etag(f'{version}-{path}')
+        last_modified = get_last_modified()
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+        key = f'posts:page:{version}:{path}'
+        response = cache.get(key)
+        if response is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200 or response.cookies:
+                return response
+            cache.set(key, response, settings.PAGE_CACHE_TIMEOUT)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+    return wrapper
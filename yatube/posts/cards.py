@@ -0,0 +1,57 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from . import thumbnails
+
+CARD_TEMPLATE = 'includes/post_lineboard.html'
+
+
+def post_version(post):
+    """
+    Версия карточки по полям, которые она показывает: меняется при
+    правке текста, смене группы или картинки и новом комментарии.
+    """
+    raw = '|'.join(str(value) for value in (
+        post.text, post.group_id, post.image.name or '',
+        post.comments_count, post.author_id, post.author.username,
+        post.pub_date.isoformat(),
+    ))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def card_key(post):
+    return f'posts:card:{post.pk}:{post_version(post)}'
+
+
+def _ready(post):
+    # Пока миниатюры создаются в фоне, в карточке ссылка на исходную
+    # картинку или неполный srcset; такая карточка не кэшируется,
+    # чтобы не застрять.
+    return not post.image or post.thumbnails_ready
+
+
+def render_cards(posts):
+    """
+    HTML карточек постов в порядке posts. Готовые карточки берутся из
+    кэша одним get_many и общие для всех лент; рендерятся только
+    промахи, и для них же одним запросом готовятся миниатюры.
+    """
+    posts = list(posts)
+    keys = {post.pk: card_key(post) for post in posts}
+    cards = cache.get_many(list(keys.values()))
+    missing = [post for post in posts if keys[post.pk] not in cards]
+    if missing:
+        thumbnails.attach_thumbnails(missing, 'card')
+        template = get_template(CARD_TEMPLATE)
+        rendered = {}
+        for post in missing:
+            html = template.render({'post': post})
+            cards[keys[post.pk]] = html
+            if _ready(post):
+                rendered[keys[post.pk]] = html
+        cache.set_many(rendered, settings.CARD_CACHE_TIMEOUT)
+    return [(post, mark_safe(cards[keys[post.pk]])) for post in posts]
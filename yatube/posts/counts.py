@@ -0,0 +1,194 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import (Count, F, IntegerField, Max, OuterRef, Subquery,
+                              Sum)
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Follow, Group, Post, UserStats
+
+User = get_user_model()
+
+ALL = 'all'
+FOLLOW = 'follow'
+
+
+def count_key(shape, pk=None):
+    """Ключ кэша для числа постов в выборке заданной формы."""
+    if pk is None:
+        return f'posts:count:{shape}'
+    return f'posts:count:{shape}:{pk}'
+
+
+def cached_count(key, compute, version=None):
+    """
+    Число из кэша или compute(). С version значение хранится вместе
+    с ней и при другой версии считается заново.
+    """
+    if version is None:
+        count = cache.get(key)
+        if count is None:
+            count = compute()
+            cache.set(key, count, settings.POSTS_COUNT_TIMEOUT)
+        return count
+    cached = cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    count = compute()
+    cache.set(key, (version, count), settings.POSTS_COUNT_TIMEOUT)
+    return count
+
+
+def estimate_or_count(queryset):
+    """
+    Для большой таблицы вместо COUNT(*) берём максимальный id:
+    он читается из первичного ключа и отличается от точного числа
+    только на количество удалённых постов.
+    """
+    estimate = Post.objects.aggregate(Max('pk'))['pk__max'] or 0
+    if estimate > settings.POSTS_COUNT_ESTIMATE_THRESHOLD:
+        return estimate
+    return queryset.count()
+
+
+def count_for(key, queryset):
+    """Число постов выборки из кэша; для всей ленты допускается оценка."""
+    if key == count_key(ALL):
+        return cached_count(key, lambda: estimate_or_count(queryset))
+    return cached_count(key, queryset.count)
+
+
+def _adjust(keys, delta):
+    for key in keys:
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            # Счётчика нет в кэше: он будет посчитан при первом чтении.
+            pass
+
+
+def follow_feeds_changed(user_ids):
+    cache.delete_many([count_key(FOLLOW, user_id) for user_id in user_ids])
+
+
+def author_followers_changed(author_id):
+    """
+    Сбрасывает число постов в лентах всех подписчиков автора после
+    удаления его поста. Посты популярного автора в закэшированное
+    число не входят, и его подписчиков не перебираем.
+    """
+    if UserStats.objects.filter(user_id=author_id, feed_pulled=True).exists():
+        return
+    follow_feeds_changed(Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True))
+
+
+def _bump(queryset, **deltas):
+    # Счётчики беззнаковые (CHECK >= 0): если значение разошлось с
+    # данными и уже равно нулю, уменьшение не должно ронять удаление.
+    return queryset.update(**{
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+    })
+
+
+def bump_user(user_id, **deltas):
+    """
+    Меняет счётчики пользователя. Если строки UserStats ещё нет,
+    при увеличении она пересчитывается целиком, уменьшение
+    пропускается: пользователь мог быть удалён каскадом.
+    """
+    updated = _bump(UserStats.objects.filter(user_id=user_id), **deltas)
+    if not updated and min(deltas.values()) > 0:
+        reconcile_users(User.objects.filter(pk=user_id))
+
+
+def bump_group(group_id, delta):
+    if group_id is not None:
+        _bump(Group.objects.filter(pk=group_id), posts_count=delta)
+
+
+def post_added(post):
+    _adjust([count_key(ALL)], 1)
+    bump_user(post.author_id, posts_count=1)
+    bump_group(post.group_id, 1)
+
+
+def post_removed(post):
+    _adjust([count_key(ALL)], -1)
+    author_followers_changed(post.author_id)
+    bump_user(post.author_id, posts_count=-1)
+    bump_group(post.group_id, -1)
+
+
+def group_changed(old_group_id, new_group_id):
+    bump_group(old_group_id, -1)
+    bump_group(new_group_id, 1)
+
+
+def comment_added(comment):
+    _bump(Post.objects.filter(pk=comment.post_id), comments_count=1)
+
+
+def comment_removed(comment):
+    _bump(Post.objects.filter(pk=comment.post_id), comments_count=-1)
+
+
+def follow_added(follow):
+    bump_user(follow.author_id, followers_count=1)
+    bump_user(follow.user_id, following_count=1)
+
+
+def follow_removed(follow):
+    bump_user(follow.author_id, followers_count=-1)
+    bump_user(follow.user_id, following_count=-1)
+
+
+def user_stats(user):
+    """Счётчики пользователя; отсутствующая строка пересчитывается."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        reconcile_users(User.objects.filter(pk=user.pk))
+        return UserStats.objects.get(user=user)
+
+
+def _count_of(queryset, field):
+    counted = queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+        field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def reconcile_users(users=None):
+    """Пересчитывает счётчики пользователей по данным Post и Follow."""
+    if users is None:
+        users = User.objects.all()
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=pk)
+         for pk in users.filter(stats__isnull=True).values_list(
+             'pk', flat=True)),
+        ignore_conflicts=True,
+    )
+    return UserStats.objects.filter(user__in=users).update(
+        posts_count=_count_of(Post.objects.all(), 'author'),
+        followers_count=_count_of(Follow.objects.all(), 'author'),
+        following_count=_count_of(Follow.objects.all(), 'user'),
+    )
+
+
+def reconcile_counters():
+    """Исправляет расхождения всех хранимых счётчиков."""
+    cache.delete(count_key(ALL))
+    return {
+        'users': reconcile_users(),
+        'groups': Group.objects.update(
+            posts_count=_count_of(Post.objects.all(), 'group')),
+        'posts': Post.objects.update(
+            comments_count=_count_of(Comment.objects.all(), 'post')),
+    }
+
+
+def authors_count(author_ids):
+    """Суммарное число постов авторов по их счётчикам."""
+    return UserStats.objects.filter(user_id__in=author_ids).aggregate(
+        total=Sum('posts_count'))['total'] or 0
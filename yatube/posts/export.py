@@ -0,0 +1,99 @@
+import json
+import zipfile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Group
+
+# Поля записей совпадают с форматом команды import_data.
+POST_FIELDS = ('id', 'author', 'group__slug', 'text', 'image', 'pub_date')
+COMMENT_FIELDS = ('id', 'post', 'author', 'text', 'created')
+
+
+def _rows(queryset, *fields):
+    return queryset.values(*fields).iterator(
+        chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def records(user):
+    """
+    Профиль, его группы, посты, комментарии и подписки пользователя.
+    Строки читаются из базы порциями по EXPORT_CHUNK_SIZE, поэтому
+    память не зависит от размера аккаунта.
+    """
+    yield {
+        'type': 'user', 'id': user.pk, 'username': user.username,
+        'email': user.email, 'first_name': user.first_name,
+        'last_name': user.last_name,
+    }
+    groups = Group.objects.filter(posts__author=user).distinct()
+    for group in _rows(groups.order_by('pk'), 'slug', 'title',
+                       'description'):
+        yield {'type': 'group', 'id': group['slug'], **group}
+    posts = user.posts.order_by('pub_date', 'id')
+    for post in _rows(posts, *POST_FIELDS):
+        post['group'] = post.pop('group__slug')
+        yield {'type': 'post', **post}
+    for comment in _rows(user.comments.order_by('id'), *COMMENT_FIELDS):
+        yield {'type': 'comment', **comment}
+    follows = user.follower.order_by('id')
+    for follow in _rows(follows, 'user', 'author', 'author__username'):
+        yield {'type': 'follow', **follow}
+
+
+def jsonl_chunks(user):
+    for record in records(user):
+        yield json.dumps(record, ensure_ascii=False,
+                         cls=DjangoJSONEncoder).encode() + b'\n'
+
+
+class _Buffer:
+    # ZipFile пишет сюда, а генератор отдаёт накопленное клиенту.
+    # Без seek и tell ZipFile сам пишет размеры после данных файла.
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def _image_names(user):
+    images = user.posts.exclude(image='').exclude(image=None)
+    return images.values_list('image', flat=True).iterator(
+        chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def zip_chunks(user):
+    """Архив с data.jsonl и картинками постов, собираемый на лету."""
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        with archive.open('data.jsonl', 'w', force_zip64=True) as entry:
+            for chunk in jsonl_chunks(user):
+                entry.write(chunk)
+                yield from buffer.drain()
+        for name in _image_names(user):
+            if not default_storage.exists(name):
+                continue
+            with default_storage.open(name) as source, \
+                    archive.open(name, 'w', force_zip64=True) as entry:
+                for chunk in source.chunks():
+                    entry.write(chunk)
+                    yield from buffer.drain()
+    yield from buffer.drain()
+
+
+FORMATS = {
+    'jsonl': (jsonl_chunks, 'application/x-ndjson'),
+    'zip': (zip_chunks, 'application/zip'),
+}
@@ -0,0 +1,102 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.syndication.views import Feed
+from django.shortcuts import get_object_or_404
+from django.template.defaultfilters import linebreaks, truncatechars
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+
+from .cache import anonymous_page_cache
+from .models import Group, Post
+
+User = get_user_model()
+
+
+class PostsFeed(Feed):
+    """Последние посты всего сайта."""
+
+    def title(self, obj):
+        return 'Yatube: последние записи'
+
+    def description(self, obj):
+        return 'Новые посты всех авторов'
+
+    def subtitle(self, obj):
+        # Atom берёт подзаголовок, RSS — описание.
+        return self.description(obj)
+
+    def link(self, obj):
+        return reverse('posts:index')
+
+    def posts(self, obj):
+        return Post.objects.all()
+
+    def items(self, obj):
+        return self.posts(obj).select_related('author', 'group')[
+            :settings.FEED_ITEMS]
+
+    def item_title(self, item):
+        return truncatechars(item.text, 50)
+
+    def item_description(self, item):
+        return linebreaks(item.text)
+
+    def item_link(self, item):
+        return reverse('posts:post_detail', args=[item.pk])
+
+    def item_pubdate(self, item):
+        return item.pub_date
+
+    def item_author_name(self, item):
+        return item.author.get_full_name() or item.author.username
+
+    def item_categories(self, item):
+        return [item.group.title] if item.group else []
+
+
+class GroupFeed(PostsFeed):
+    def get_object(self, request, slug):
+        return get_object_or_404(Group, slug=slug)
+
+    def title(self, obj):
+        return f'Yatube: {obj.title}'
+
+    def description(self, obj):
+        return obj.description
+
+    def link(self, obj):
+        return reverse('posts:group_list', args=[obj.slug])
+
+    def posts(self, obj):
+        return obj.posts.all()
+
+
+class AuthorFeed(PostsFeed):
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def title(self, obj):
+        return f'Yatube: записи {obj.get_full_name() or obj.username}'
+
+    def description(self, obj):
+        return f'Новые посты пользователя {obj.username}'
+
+    def link(self, obj):
+        return reverse('posts:profile', args=[obj.username])
+
+    def posts(self, obj):
+        return obj.posts.all()
+
+
+def _feeds(feed_class):
+    # Лента рендерится один раз на версию содержимого, а опрос с
+    # If-None-Match или If-Modified-Since получает 304 без запросов к базе.
+    atom_class = type(f'Atom{feed_class.__name__}', (feed_class,),
+                      {'feed_type': Atom1Feed})
+    return (anonymous_page_cache(feed_class()),
+            anonymous_page_cache(atom_class()))
+
+
+index_rss, index_atom = _feeds(PostsFeed)
+group_rss, group_atom = _feeds(GroupFeed)
+author_rss, author_atom = _feeds(AuthorFeed)
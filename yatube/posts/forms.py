@@ -1,5 +1,7 @@
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import ModelForm
 
+from .images import normalize_image
 from .models import Comment, Post
 
 
@@ -10,6 +12,12 @@ class PostForm(ModelForm):
         help_texts = {'group': 'Выберите группу', 'text': 'Введите ссообщение'}
         fields = ('group', 'text', 'image')
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if isinstance(image, UploadedFile):
+            return normalize_image(image)
+        return image
+
 
 class CommentForm(ModelForm):
     class Meta:
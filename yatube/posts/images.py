@@ -0,0 +1,40 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+
+def _has_alpha(image):
+    return (image.mode in ('RGBA', 'LA')
+            or (image.mode == 'P' and 'transparency' in image.info))
+
+
+def normalize_image(upload):
+    """
+    Готовит загруженную картинку к хранению: поворачивает по EXIF,
+    уменьшает до IMAGE_MAX_SIZE и пересохраняет без метаданных.
+    Фото становятся прогрессивным JPEG, картинки с прозрачностью —
+    PNG. Анимированные GIF сохраняются как есть.
+    """
+    upload.seek(0)
+    image = Image.open(upload)
+    if getattr(image, 'is_animated', False):
+        upload.seek(0)
+        return upload
+    icc_profile = image.info.get('icc_profile')
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(settings.IMAGE_MAX_SIZE, Image.LANCZOS)
+    buffer = BytesIO()
+    if _has_alpha(image):
+        image.save(buffer, 'PNG', optimize=True, icc_profile=icc_profile)
+        extension = 'png'
+    else:
+        image.convert('RGB').save(
+            buffer, 'JPEG', quality=settings.IMAGE_QUALITY, optimize=True,
+            progressive=True, icc_profile=icc_profile,
+        )
+        extension = 'jpg'
+    stem = os.path.splitext(os.path.basename(upload.name))[0]
+    return ContentFile(buffer.getvalue(), name=f'{stem}.{extension}')
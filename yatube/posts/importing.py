@@ -0,0 +1,365 @@
+import csv
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import counts, search
+from .cache import bump_version
+from .models import Comment, Follow, Group, Post
+from .timeline import rebuild_timelines
+
+User = get_user_model()
+
+# Типы записей в порядке, в котором они должны идти во входных данных:
+# запись может ссылаться только на уже прочитанные.
+KINDS = ('user', 'group', 'post', 'comment', 'follow')
+# Сколько значений уходит в один запрос username__in / slug__in.
+NATURAL_CHUNK = 500
+
+
+class RecordError(Exception):
+    """Запись нельзя загрузить: она пропускается."""
+
+
+def read_records(path):
+    """
+    Потоково читает записи файла. В JSON Lines тип указан в поле type
+    каждой записи, в CSV берётся из имени файла: posts.csv и т.п.
+    Возвращает пары (номер строки, запись); строка JSON Lines
+    возвращается как есть и разбирается в parse_record.
+    """
+    stem, extension = os.path.splitext(os.path.basename(path))
+    with open(path, encoding='utf-8', newline='') as source:
+        if extension == '.csv':
+            kind = stem.rstrip('s')
+            for number, row in enumerate(csv.DictReader(source), 1):
+                yield number, {'type': kind, **row}
+        else:
+            for number, line in enumerate(source, 1):
+                if line.strip():
+                    yield number, line
+
+
+def parse_record(raw):
+    """Запись-словарь из строки JSON Lines или уже разобранной строки CSV."""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError as error:
+            raise RecordError(f'Неверный JSON: {error}')
+    if not isinstance(raw, dict):
+        raise RecordError('Запись должна быть объектом')
+    return raw
+
+
+def _date(value):
+    if not value:
+        return timezone.now()
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise RecordError(f'Неверная дата: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, timezone.utc)
+    return parsed
+
+
+@contextmanager
+def _keep_dates():
+    # bulk_create вызывает pre_save полей, и auto_now_add затёр бы
+    # даты из выгрузки. Команда работает в отдельном процессе, поэтому
+    # флаг можно снять на время импорта.
+    fields = [Post._meta.get_field('pub_date'),
+              Comment._meta.get_field('created')]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Checkpoint:
+    """
+    Состояние импорта в отдельном файле SQLite: сколько строк каждого
+    файла уже загружено, соответствие внешних id первичным ключам,
+    следующий свободный ключ каждой модели и ключи строк последней
+    пачки. Без файла состояние хранится только в памяти.
+    """
+
+    def __init__(self, path=None):
+        self.connection = sqlite3.connect(path or ':memory:')
+        self.connection.executescript(
+            'CREATE TABLE IF NOT EXISTS ids ('
+            ' kind TEXT, external TEXT, pk INTEGER,'
+            ' PRIMARY KEY (kind, external));'
+            'CREATE TABLE IF NOT EXISTS progress ('
+            ' source TEXT PRIMARY KEY, line INTEGER);'
+            'CREATE TABLE IF NOT EXISTS next_pk ('
+            ' kind TEXT PRIMARY KEY, pk INTEGER);'
+            'CREATE TABLE IF NOT EXISTS batch ('
+            ' source TEXT, line INTEGER, pk INTEGER,'
+            ' PRIMARY KEY (source, line));'
+        )
+        self.ids = {kind: {} for kind in KINDS}
+        for kind, external, pk in self.connection.execute(
+                'SELECT kind, external, pk FROM ids'):
+            self.ids[kind][external] = pk
+        self.next_pk = dict(self.connection.execute(
+            'SELECT kind, pk FROM next_pk'))
+        self.replay = {
+            (source, line): pk for source, line, pk in
+            self.connection.execute('SELECT source, line, pk FROM batch')
+        }
+        self.synced = set()
+        self.pending = []
+        self.lines = []
+
+    def line(self, source):
+        row = self.connection.execute(
+            'SELECT line FROM progress WHERE source = ?', (source,),
+        ).fetchone()
+        return row[0] if row else 0
+
+    def replayed(self, source, line):
+        """Ключ, выделенный строке в прерванной пачке, или None."""
+        return self.replay.get((source, line))
+
+    def link(self, kind, external, pk):
+        if external:
+            self.ids[kind][external] = pk
+            self.pending.append((kind, external, pk))
+
+    def remember(self, source, line, pk):
+        self.lines.append((source, line, pk))
+
+    def allocate(self, kind, model):
+        if kind not in self.synced:
+            # В базе могли появиться строки после прошлого запуска:
+            # продолжаем за большим из сохранённого и MAX(pk) + 1.
+            current = (model.objects.aggregate(Max('pk'))['pk__max'] or 0) + 1
+            self.next_pk[kind] = max(self.next_pk.get(kind, 0), current)
+            self.synced.add(kind)
+        pk = self.next_pk[kind]
+        self.next_pk[kind] += 1
+        return pk
+
+    def save_batch(self):
+        """Сохраняет ключи пачки до её вставки в базу."""
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO ids VALUES (?, ?, ?)', self.pending)
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO next_pk VALUES (?, ?)',
+                self.next_pk.items())
+            self.connection.execute('DELETE FROM batch')
+            self.connection.executemany(
+                'INSERT INTO batch VALUES (?, ?, ?)', self.lines)
+        self.pending = []
+        self.lines = []
+
+    def save_progress(self, source, line):
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO progress VALUES (?, ?)',
+                (source, line))
+
+
+class Importer:
+    """
+    Загружает записи пачками через bulk_create. Первичные ключи
+    выделяются заранее, поэтому внешние ключи разрешаются по словарям
+    в памяти без чтения вставленных строк. Ключи пачки записываются
+    в checkpoint до вставки: если процесс упал после фиксации пачки,
+    повтор берёт те же ключи и пропускает уже вставленные строки.
+    """
+
+    def __init__(self, checkpoint, batch_size=1000):
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self.loaded = {kind: 0 for kind in KINDS}
+        self.skipped = 0
+        self.natural = {}
+
+    def ref(self, kind, external):
+        if external in (None, ''):
+            return None
+        try:
+            return self.checkpoint.ids[kind][str(external)]
+        except KeyError:
+            raise RecordError(f'Неизвестный {kind}: {external}')
+
+    def prefetch(self, records):
+        """Ищет пользователей и группы пачки в базе запросами по IN."""
+        for kind, model, field in (('user', User, 'username'),
+                                   ('group', Group, 'slug')):
+            values = list({
+                record[field] for record in records
+                if record.get('type') == kind
+                and isinstance(record.get(field), str)
+                and (model, record[field]) not in self.natural
+            })
+            for start in range(0, len(values), NATURAL_CHUNK):
+                chunk = values[start:start + NATURAL_CHUNK]
+                found = dict(model.objects.filter(
+                    **{f'{field}__in': chunk}).values_list(field, 'pk'))
+                for value in chunk:
+                    self.natural[(model, value)] = found.get(value)
+
+    def existing(self, model, field, value):
+        # Пользователи и группы, которые уже есть в базе или встречались
+        # раньше во входных данных, не создаются заново: на них
+        # просто ссылаются. Обычно ключ уже найден в prefetch.
+        key = (model, value)
+        if key not in self.natural:
+            self.natural[key] = model.objects.filter(
+                **{field: value}).values_list('pk', flat=True).first()
+        return self.natural[key]
+
+    def _build_user(self, record):
+        return User(
+            username=record['username'],
+            email=record.get('email', ''),
+            first_name=record.get('first_name', ''),
+            last_name=record.get('last_name', ''),
+            password=record.get('password') or make_password(None),
+        ), ('username', record['username'])
+
+    def _build_group(self, record):
+        return Group(
+            title=record['title'],
+            slug=record['slug'],
+            description=record.get('description', ''),
+        ), ('slug', record['slug'])
+
+    def _build_post(self, record):
+        return Post(
+            author_id=self.ref('user', record['author']),
+            group_id=self.ref('group', record.get('group')),
+            text=record['text'],
+            image=record.get('image', ''),
+            pub_date=_date(record.get('pub_date')),
+        ), None
+
+    def _build_comment(self, record):
+        return Comment(
+            post_id=self.ref('post', record['post']),
+            author_id=self.ref('user', record['author']),
+            text=record['text'],
+            created=_date(record.get('created')),
+        ), None
+
+    def _build_follow(self, record):
+        return Follow(
+            user_id=self.ref('user', record['user']),
+            author_id=self.ref('user', record['author']),
+        ), None
+
+    def build(self, record, source, number):
+        """Объект для bulk_create или None, если создавать нечего."""
+        kind = record.get('type')
+        if kind not in KINDS:
+            raise RecordError(f'Неизвестный тип записи: {kind}')
+        obj, natural = getattr(self, f'_build_{kind}')(record)
+        if kind == 'follow':
+            return obj
+        model = type(obj)
+        external = str(record.get('id', '')) or None
+        if natural is not None:
+            pk = self.existing(model, *natural)
+            if pk is not None:
+                self.checkpoint.link(kind, external, pk)
+                return None
+        # Ключ выделяется последним, когда все ссылки уже разрешены.
+        pk = self.checkpoint.replayed(source, number)
+        obj._replayed = pk is not None
+        if pk is None:
+            pk = self.checkpoint.allocate(kind, model)
+        obj.pk = pk
+        self.checkpoint.link(kind, external, pk)
+        self.checkpoint.remember(source, number, pk)
+        if natural is not None:
+            self.natural[(model, natural[1])] = pk
+        return obj
+
+    def _not_inserted(self, model, batch):
+        # Повторяемая пачка могла быть уже зафиксирована целиком.
+        replayed = [obj.pk for obj in batch if obj._replayed]
+        if not replayed:
+            return batch
+        inserted = set(model.objects.filter(pk__in=replayed).values_list(
+            'pk', flat=True))
+        return [obj for obj in batch if obj.pk not in inserted]
+
+    def flush(self, objects):
+        for model in (User, Group, Post, Comment, Follow):
+            batch = [obj for obj in objects if type(obj) is model]
+            if model is not Follow:
+                batch = self._not_inserted(model, batch)
+            if batch:
+                # Конфликт ключей пользователей, групп, постов и
+                # комментариев — ошибка, а не повтор: он не глушится.
+                # Повторная подписка просто пропускается.
+                model.objects.bulk_create(
+                    batch, batch_size=self.batch_size,
+                    ignore_conflicts=model is Follow)
+                self.loaded[model._meta.model_name] += len(batch)
+
+    def skip(self, path, number, error, on_error):
+        self.skipped += 1
+        if on_error is not None:
+            on_error(path, number, error)
+
+    def load(self, path, on_error=None):
+        """Загружает файл пачками, продолжая с сохранённой строки."""
+        source = os.path.abspath(path)
+        start = self.checkpoint.line(source)
+        records = (item for item in read_records(path) if item[0] > start)
+        with _keep_dates():
+            while True:
+                parsed = []
+                last = None
+                for number, raw in islice(records, self.batch_size):
+                    last = number
+                    try:
+                        parsed.append((number, parse_record(raw)))
+                    except RecordError as error:
+                        self.skip(path, number, error, on_error)
+                if last is None:
+                    break
+                self.prefetch([record for _, record in parsed])
+                objects = []
+                for number, record in parsed:
+                    try:
+                        obj = self.build(record, source, number)
+                    except (RecordError, KeyError, ValueError) as error:
+                        self.skip(path, number, error, on_error)
+                        continue
+                    if obj is not None:
+                        objects.append(obj)
+                self.checkpoint.save_batch()
+                with transaction.atomic():
+                    self.flush(objects)
+                self.checkpoint.save_progress(source, last)
+
+    def finish(self):
+        """Пересчитывает всё, что bulk_create обошёл без сигналов."""
+        models = [User, Group, Post, Comment]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                    no_style(), models):
+                cursor.execute(sql)
+        counts.reconcile_counters()
+        rebuild_timelines()
+        search.rebuild()
+        bump_version()
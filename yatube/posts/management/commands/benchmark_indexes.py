@@ -0,0 +1,128 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+FEED_INDEXES = (
+    (Post, 'post_date_idx'),
+    (Post, 'post_author_date_idx'),
+    (Post, 'post_group_date_idx'),
+    (Comment, 'comment_post_created_idx'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу тестовыми данными и сравнивает планы и время '
+        'запросов лент с составными индексами и без них. Все изменения '
+        'откатываются в конце.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.stderr.write('Нужна СУБД с транзакционным DDL.')
+            return
+        with transaction.atomic():
+            self.seed(options)
+            self.report('С индексами', options['repeat'])
+            self.drop_indexes()
+            self.report('Без индексов', options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, options):
+        users = User.objects.bulk_create(
+            User(username=f'bench_{i}') for i in range(options['users']))
+        groups = Group.objects.bulk_create(
+            Group(title=f'bench {i}', slug=f'bench-{i}', description='')
+            for i in range(options['groups']))
+        user_ids = list(User.objects.filter(
+            username__in=[user.username for user in users]
+        ).values_list('id', flat=True))
+        group_ids = list(Group.objects.filter(
+            slug__in=[group.slug for group in groups]
+        ).values_list('id', flat=True))
+        Post.objects.bulk_create(
+            (Post(text=f'bench {i}',
+                  author_id=user_ids[i % len(user_ids)],
+                  group_id=group_ids[i % len(group_ids)])
+             for i in range(options['posts'])),
+            batch_size=500,
+        )
+        post_ids = list(Post.objects.filter(
+            author_id__in=user_ids).values_list('id', flat=True))
+        Comment.objects.bulk_create(
+            (Comment(text=f'bench {i}',
+                     post_id=post_ids[i % len(post_ids)],
+                     author_id=user_ids[i % len(user_ids)])
+             for i in range(options['comments'])),
+            batch_size=500,
+        )
+        Follow.objects.bulk_create(
+            Follow(user_id=user_id, author_id=user_ids[0])
+            for user_id in user_ids[1:])
+        self.sample = {
+            'author': user_ids[len(user_ids) // 2],
+            'group': group_ids[len(group_ids) // 2],
+            'post': post_ids[len(post_ids) // 2],
+            'user': user_ids[-1],
+            'followed': user_ids[0],
+        }
+
+    def queries(self):
+        sample = self.sample
+        feed = Post.objects.order_by('-pub_date', '-id')
+        return {
+            'Все посты': feed[:10],
+            'Посты автора': feed.filter(author_id=sample['author'])[:10],
+            'Посты группы': feed.filter(group_id=sample['group'])[:10],
+            'Комментарии поста': Comment.objects.filter(
+                post_id=sample['post']).order_by('created', 'id')[:50],
+            'Есть ли подписка': Follow.objects.filter(
+                user_id=sample['user'], author_id=sample['followed']),
+        }
+
+    def report(self, title, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for name, queryset in self.queries().items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append(time.perf_counter() - started)
+            median = statistics.median(timings) * 1000
+            self.stdout.write(f'{name}: {median:.3f} мс')
+            for line in self.explain(queryset, title):
+                self.stdout.write(f'    {line}')
+
+    def explain(self, queryset, title):
+        # Комментарий с названием прогона делает текст запроса другим:
+        # иначе sqlite3 вернёт план из кэша подготовленных выражений.
+        sql, params = queryset.query.sql_with_params()
+        prefix = connection.ops.explain_query_prefix()
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefix} /* {title} */ {sql}', params)
+            return [' '.join(str(column) for column in row)
+                    for row in cursor.fetchall()]
+
+    def drop_indexes(self):
+        # SQLite не даёт открыть schema_editor внутри транзакции,
+        # поэтому выполняем только готовый DROP INDEX.
+        editor = connection.schema_editor()
+        with connection.cursor() as cursor:
+            for model, name in FEED_INDEXES:
+                index = next(index for index in model._meta.indexes
+                             if index.name == name)
+                cursor.execute(str(index.remove_sql(model, editor)))
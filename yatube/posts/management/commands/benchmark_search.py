@@ -0,0 +1,84 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search
+from posts.models import Post
+
+User = get_user_model()
+
+SYLLABLES = ('ка', 'ро', 'ми', 'ту', 'ле', 'за', 'но', 'ви', 'шо', 'да')
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу тестовыми постами и сравнивает полнотекстовый '
+        'поиск с LIKE. Все изменения откатываются в конце.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=50000)
+        parser.add_argument('--words', type=int, default=30)
+        parser.add_argument('--vocabulary', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        if not search.available():
+            self.stderr.write('Полнотекстовый индекс есть только в SQLite.')
+            return
+        vocabulary = self.vocabulary(options['vocabulary'])
+        with transaction.atomic():
+            self.seed(options, vocabulary)
+            # Частое, среднее и редкое слово, два слова и начало слова.
+            for query in (vocabulary[0], vocabulary[50], vocabulary[-1],
+                          f'{vocabulary[1]} {vocabulary[20]}',
+                          vocabulary[10][:3]):
+                self.report(query, options['repeat'])
+            transaction.set_rollback(True)
+
+    def vocabulary(self, size):
+        words = []
+        number = 0
+        while len(words) < size:
+            digits = str(number)
+            words.append(''.join(SYLLABLES[int(digit)] for digit in digits))
+            number += 1
+        return words
+
+    def seed(self, options, vocabulary):
+        author = User.objects.create(username='bench_search')
+        rng = random.Random(0)
+        # Частоты слов по закону Ципфа, как в живых текстах.
+        weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+        Post.objects.bulk_create(
+            (Post(author=author, text=' '.join(rng.choices(
+                vocabulary, weights, k=options['words'])))
+             for _ in range(options['posts'])),
+            batch_size=500,
+        )
+        search.rebuild()
+
+    def report(self, query, repeat):
+        like = Post.objects.all()
+        for word in query.split():
+            like = like.filter(text__icontains=word)
+        paths = {
+            'FTS5': lambda: search.search_posts(query),
+            'LIKE': lambda: list(like.order_by('-pub_date', '-id')[:10]),
+            'FTS5, число': lambda: search.filter_matching(
+                Post.objects.all(), query).count(),
+            'LIKE, число': like.count,
+        }
+        self.stdout.write(self.style.MIGRATE_HEADING(query))
+        for name, run in paths.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - started)
+            median = statistics.median(timings) * 1000
+            self.stdout.write(f'{name}: {median:.3f} мс')
@@ -0,0 +1,35 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.export import FORMATS
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты, комментарии и подписки пользователя'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--format', choices=FORMATS, default='jsonl')
+        parser.add_argument(
+            '--output', help='файл выгрузки; по умолчанию stdout')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(
+                f'Пользователь {options["username"]} не найден')
+        chunks, _ = FORMATS[options['format']]
+        if options['output'] is None:
+            self.write(chunks(user), sys.stdout.buffer)
+            return
+        with open(options['output'], 'wb') as output:
+            self.write(chunks(user), output)
+
+    def write(self, chunks, output):
+        for chunk in chunks:
+            output.write(chunk)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts.cache import cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания, промахи и отдачу устаревших фрагментов'
+
+    def handle(self, *args, **options):
+        for name, count in cache_stats().items():
+            self.stdout.write(f'{name}: {count}')
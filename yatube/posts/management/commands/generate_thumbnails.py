@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Создаёт недостающие миниатюры для всех картинок постов'
+
+    def handle(self, *args, **options):
+        names = Post.objects.exclude(image='').values_list(
+            'image', flat=True).distinct()
+        count = 0
+        for count, name in enumerate(names.iterator(), 1):
+            thumbnails.generate(name)
+        self.stdout.write(f'Обработано картинок: {count}')
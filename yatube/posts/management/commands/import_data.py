@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from posts.importing import Checkpoint, Importer
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоково загружает пользователей, группы, посты, комментарии и '
+        'подписки из JSON Lines (тип в поле type) или CSV (тип по имени '
+        'файла: users.csv, groups.csv, posts.csv, comments.csv, '
+        'follows.csv). Записи могут ссылаться только на прочитанные ранее. '
+        'Сигналы не вызываются: счётчики, ленты и поисковый индекс '
+        'пересчитываются в конце.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--checkpoint',
+            help='файл состояния: с ним прерванный импорт продолжается',
+        )
+
+    def handle(self, *args, **options):
+        importer = Importer(Checkpoint(options['checkpoint']),
+                            options['batch_size'])
+        for path in options['files']:
+            importer.load(path, on_error=self.report_error)
+        self.stdout.write('Пересчёт счётчиков, лент и поискового индекса')
+        importer.finish()
+        for kind, count in importer.loaded.items():
+            self.stdout.write(f'{kind}: {count}')
+        if importer.skipped:
+            self.stderr.write(f'Пропущено записей: {importer.skipped}')
+
+    def report_error(self, path, number, error):
+        self.stderr.write(f'{path}:{number}: {error}')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = (
+        'Заново строит полнотекстовые индексы постов и комментариев. '
+        'Нужен после bulk_create и update(), которые не вызывают сигналы.'
+    )
+
+    def handle(self, *args, **options):
+        if not search.available():
+            self.stderr.write('Полнотекстовый индекс есть только в SQLite.')
+            return
+        for name, count in search.rebuild().items():
+            self.stdout.write(f'{name}: {count}')
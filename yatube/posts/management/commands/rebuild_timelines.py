@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts.timeline import rebuild_timelines
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает ленты подписок по данным Follow и Post'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='id пользователя, чью ленту нужно пересобрать',
+        )
+
+    def handle(self, *args, **options):
+        count = rebuild_timelines(options['users'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Лент пересобрано по подпискам: {count}'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from posts.counts import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает хранимые счётчики постов, комментариев и подписок'
+
+    def handle(self, *args, **options):
+        for name, count in reconcile_counters().items():
+            self.stdout.write(f'{name}: пересчитано {count}')
+        self.stdout.write(self.style.SUCCESS('Счётчики сверены'))
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE posts_comment_fts USING fts5("
+        "text, tokenize = 'unicode61 remove_diacritics 2')")
+    schema_editor.execute(
+        'INSERT INTO posts_comment_fts (rowid, text) '
+        'SELECT id, text FROM posts_comment')
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_comment_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_post_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-18 07:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_pulled(apps, schema_editor):
+    UserStats = apps.get_model('posts', 'UserStats')
+    UserStats.objects.filter(
+        followers_count__gt=settings.FEED_PULL_THRESHOLD,
+    ).update(feed_pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_comment_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='feed_pulled',
+            field=models.BooleanField(default=False, verbose_name='Посты читаются при открытии ленты'),
+        ),
+        migrations.RunPython(mark_pulled, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,138 @@
+import json
+import threading
+import time
+
+from django.conf import settings
+
+from .cache import get_version
+from .models import Post
+
+ALL = 'all'
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def follow_scope(user_id):
+    return f'follow:{user_id}'
+
+
+def _posts(scope):
+    kind, _, pk = scope.partition(':')
+    if kind == 'group':
+        return Post.objects.filter(group_id=pk)
+    if kind == 'follow':
+        return Post.objects.filter(author__following__user_id=pk)
+    return Post.objects.all()
+
+
+class Notifier:
+    """
+    Новые посты по областям: вся лента, группа или подписки
+    пользователя. Для каждой области в памяти процесса лежат id
+    последних NOTIFY_RECENT постов; ждущие клиенты спят на Condition
+    и не обращаются к базе, пока ничего не изменилось. Посты из других
+    процессов замечаются по версии содержимого в общем кэше.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.version = None
+        self.recent = {}
+        self.generation = 0
+
+    def _reset(self):
+        # Вызывается под блокировкой. Списки, прочитанные до сброса,
+        # по номеру поколения не попадут в новый словарь.
+        self.recent = {}
+        self.generation += 1
+
+    def publish(self):
+        """Будит ждущих: вызывается после фиксации нового поста."""
+        with self.condition:
+            self._reset()
+            self.condition.notify_all()
+
+    def _ids(self, scope):
+        """id последних постов области и номер поколения списков."""
+        version = get_version()
+        with self.condition:
+            if version != self.version:
+                self.version = version
+                self._reset()
+            generation = self.generation
+            ids = self.recent.get(scope)
+        if ids is None:
+            # Запрос идёт без блокировки, чтобы ждущие потоки не
+            # выстраивались за ним в очередь.
+            ids = list(_posts(scope).order_by('-id').values_list(
+                'id', flat=True)[:settings.NOTIFY_RECENT])
+            with self.condition:
+                if self.generation == generation:
+                    self.recent[scope] = ids
+        return ids, generation
+
+    def state(self, scope, since):
+        """(число постов области новее since, id самого нового поста)."""
+        ids, _ = self._ids(scope)
+        count = 0
+        for pk in ids:
+            if pk <= since:
+                break
+            count += 1
+        if count == settings.NOTIFY_RECENT:
+            count = _posts(scope).filter(id__gt=since).count()
+        return count, ids[0] if ids else 0
+
+    def wait(self, scope, after, timeout):
+        """
+        Ждёт поста новее after не дольше timeout секунд. Раз в
+        NOTIFY_POLL_INTERVAL сверяется с кэшем, чтобы заметить посты,
+        созданные другими процессами. Возвращает id самого нового поста.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            ids, generation = self._ids(scope)
+            latest = ids[0] if ids else 0
+            remaining = deadline - time.monotonic()
+            if latest > after or remaining <= 0:
+                return latest
+            with self.condition:
+                # publish между чтением и ожиданием не должен потеряться.
+                if self.generation == generation:
+                    self.condition.wait(
+                        min(remaining, settings.NOTIFY_POLL_INTERVAL))
+
+
+notifier = Notifier()
+
+
+def _event(count, latest):
+    data = json.dumps({'count': count, 'latest': latest})
+    return f'id: {latest}\nevent: posts\ndata: {data}\n\n'
+
+
+def event_stream(scope, since):
+    """
+    Поток server-sent events: событие posts при каждом новом посте
+    и комментарий-пинг раз в NOTIFY_HEARTBEAT секунд. Через
+    NOTIFY_STREAM_DURATION поток закрывается, и браузер переподключается
+    с Last-Event-ID.
+    """
+    yield f'retry: {settings.NOTIFY_RETRY_MS}\n\n'
+    count, sent = notifier.state(scope, since)
+    if count:
+        yield _event(count, sent)
+    deadline = time.monotonic() + settings.NOTIFY_STREAM_DURATION
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        latest = notifier.wait(
+            scope, sent, min(remaining, settings.NOTIFY_HEARTBEAT))
+        if latest > sent:
+            sent = latest
+            yield _event(notifier.state(scope, since)[0], latest)
+        else:
+            yield ': ping\n\n'
@@ -0,0 +1,139 @@
+import base64
+import binascii
+import re
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Comment, Post
+
+INDEXED = (Post, Comment)
+
+
+def available():
+    """Полнотекстовый индекс есть только в SQLite (FTS5)."""
+    return connection.vendor == 'sqlite'
+
+
+def match_query(query):
+    """
+    Запрос FTS5 из пользовательского ввода: все слова должны
+    встретиться, каждое может быть началом слова в тексте.
+    """
+    terms = re.findall(r'\w+', query.lower())
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def encode_cursor(rank, pk):
+    raw = f'{rank!r}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (rank, id) или None, если токен испорчен."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        rank, pk = raw.decode().split('|')
+        return float(rank), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def _table(model):
+    return f'{model._meta.db_table}_fts'
+
+
+def index(instance):
+    """Обновляет текст поста или комментария в индексе."""
+    if not available():
+        return
+    table = _table(type(instance))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE rowid = %s', [instance.pk])
+        cursor.execute(f'INSERT INTO {table} (rowid, text) VALUES (%s, %s)',
+                       [instance.pk, instance.text])
+
+
+def remove(instance):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {_table(type(instance))} '
+                       f'WHERE rowid = %s', [instance.pk])
+
+
+def rebuild():
+    """Заново строит индексы постов и комментариев."""
+    if not available():
+        return {}
+    rebuilt = {}
+    with connection.cursor() as cursor:
+        for model in INDEXED:
+            table = _table(model)
+            cursor.execute(f'DELETE FROM {table}')
+            cursor.execute(f'INSERT INTO {table} (rowid, text) '
+                           f'SELECT id, text FROM {model._meta.db_table}')
+            cursor.execute(f"INSERT INTO {table} ({table}) "
+                           f"VALUES ('optimize')")
+            rebuilt[model._meta.model_name] = model.objects.count()
+    return rebuilt
+
+
+def filter_matching(queryset, query):
+    """Оставляет в queryset только записи, подходящие под запрос."""
+    # RawSQL в pk__in попадает в двойные скобки, и SQLite сравнивает
+    # id только с первой строкой подзапроса, а аннотация с filter()
+    # не даёт использовать первичный ключ. Поэтому условие через extra.
+    db_table = queryset.model._meta.db_table
+    table = _table(queryset.model)
+    return queryset.extra(
+        where=[f'{db_table}.id IN (SELECT rowid FROM {table} '
+               f'WHERE {table} MATCH %s)'],
+        params=[match_query(query)],
+    )
+
+
+def _ranked(query, key, limit):
+    table = _table(Post)
+    sql = f'SELECT rowid, rank FROM {table} WHERE {table} MATCH %s'
+    params = [match_query(query)]
+    if key is not None:
+        sql += ' AND (rank > %s OR (rank = %s AND rowid > %s))'
+        params += [key[0], key[0], key[1]]
+    sql += ' ORDER BY rank, rowid LIMIT %s'
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _scanned(query, key, limit):
+    # Без FTS5: LIKE-поиск без ранжирования, новые посты первыми.
+    posts = Post.objects.filter(text__icontains=query).order_by('-id')
+    if key is not None:
+        posts = posts.filter(id__lt=key[1])
+    return [(pk, 0.0) for pk in posts.values_list('id', flat=True)[:limit]]
+
+
+def search_posts(query, key=None, limit=None):
+    """
+    Страница результатов поиска по релевантности (bm25) после курсора
+    key = (rank, id). Возвращает посты и курсор следующей страницы
+    или None, если она последняя.
+    """
+    if not match_query(query):
+        return [], None
+    if limit is None:
+        limit = settings.SEARCH_LIMIT
+    if available():
+        rows = _ranked(query, key, limit + 1)
+    else:
+        rows = _scanned(query, key, limit + 1)
+    rows, has_next = rows[:limit], len(rows) > limit
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        [pk for pk, _ in rows])
+    next_cursor = None
+    if has_next:
+        pk, rank = rows[-1]
+        next_cursor = encode_cursor(rank, pk)
+    return [posts[pk] for pk, _ in rows if pk in posts], next_cursor
@@ -0,0 +1,108 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import counts, notify, search, thumbnails, timeline
+from .cache import bump_version
+from .models import Comment, Follow, Group, Post, UserStats
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(pre_save, sender=Post)
+def post_changing(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        return
+    old = Post.objects.filter(pk=instance.pk).values(
+        'group_id', 'image').first()
+    if old is None:
+        return
+    if old['group_id'] != instance.group_id:
+        counts.group_changed(old['group_id'], instance.group_id)
+    instance._image_changed = old['image'] != instance.image.name
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counts.post_added(instance)
+        timeline.push_post(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_published(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        transaction.on_commit(notify.notifier.publish)
+
+
+@receiver(post_save, sender=Post)
+def post_image_saved(sender, instance, created, raw=False, **kwargs):
+    changed = created or getattr(instance, '_image_changed', False)
+    if raw or not changed or not instance.image:
+        return
+    name = instance.image.name
+    transaction.on_commit(lambda: thumbnails.schedule(name))
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counts.post_removed(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+def text_indexed(sender, instance, **kwargs):
+    # Записи из фикстур тоже должны находиться поиском.
+    search.index(instance)
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Comment)
+def text_unindexed(sender, instance, **kwargs):
+    search.remove(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counts.comment_added(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counts.comment_removed(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counts.follow_added(instance)
+        timeline.update_pull_state(instance.author_id)
+        timeline.follow_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counts.follow_removed(instance)
+    timeline.drop_author(instance.user_id, instance.author_id)
+    timeline.update_pull_state(instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def feed_changed(sender, raw=False, **kwargs):
+    if not raw:
+        bump_version()
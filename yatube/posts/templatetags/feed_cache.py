@@ -0,0 +1,48 @@
+import hashlib
+
+from django import template
+
+from ..cache import get_or_compute, get_version
+
+register = template.Library()
+
+
+class FeedCacheNode(template.Node):
+    def __init__(self, nodelist, timeout, name, vary_on):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        timeout = int(self.timeout.resolve(context))
+        vary = ':'.join(
+            str(variable.resolve(context)) for variable in self.vary_on)
+        digest = hashlib.md5(vary.encode()).hexdigest()
+        return get_or_compute(
+            f'posts:fragment:{self.name}:{digest}',
+            lambda: self.nodelist.render(context),
+            timeout,
+            version=get_version(),
+        )
+
+
+@register.tag
+def feedcache(parser, token):
+    """
+    Кэширует фрагмент ленты, как {% cache %}, но с версией содержимого
+    и защитой от одновременного пересчёта:
+    {% feedcache timeout name [vary_on ...] %} ... {% endfeedcache %}
+    """
+    nodelist = parser.parse(('endfeedcache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]} принимает как минимум два аргумента')
+    return FeedCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        bits[2],
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
@@ -0,0 +1,24 @@
+from django import template
+
+from .. import cards, thumbnails
+from ..models import Post
+
+register = template.Library()
+
+
+@register.simple_tag
+def attach_thumbnails(posts, alias):
+    """Готовит миниатюры и srcset для поста или всех постов страницы."""
+    if isinstance(posts, Post):
+        posts = [posts]
+    thumbnails.attach_thumbnails(posts, alias)
+    return ''
+
+
+@register.simple_tag
+def post_cards(posts):
+    """
+    Пары (пост, HTML карточки) для страницы ленты:
+    {% post_cards page_obj as cards %}.
+    """
+    return cards.render_cards(posts)
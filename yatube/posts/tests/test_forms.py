@@ -1,12 +1,14 @@
 import datetime
 import shutil
 import tempfile
+from io import BytesIO
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
 from ..models import Comment, Group, Post
 
@@ -107,3 +109,21 @@ class PostFormTests(TestCase):
         self.assertEqual(edit.author, self.post.author)
         self.assertEqual(self.group, edit.group)
         self.assertTrue(form_data['image'])
+
+    def test_uploaded_image_normalized(self):
+        """Фото поворачивается по EXIF, уменьшается и теряет метаданные."""
+        photo = BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        Image.new('RGB', (4000, 1000), 'red').save(
+            photo, 'JPEG', exif=exif.tobytes())
+        self.authorized_client.post(reverse('posts:new_post'), data={
+            'text': 'Фото с камеры',
+            'image': SimpleUploadedFile('camera.jpeg', photo.getvalue(),
+                                        content_type='image/jpeg'),
+        })
+        post = Post.objects.get(text='Фото с камеры')
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.size, (640, 2560))
+            self.assertFalse(stored.getexif())
@@ -1,7 +1,18 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
-from ..models import Group, Post
+from .. import search
+from ..importing import Checkpoint
+from ..models import Comment, Follow, Group, Post, Timeline, UserStats
 
 User = get_user_model()
 COUNT_TEXT = 15
@@ -53,3 +64,173 @@ class GroupModelTest(TestCase):
         group = GroupModelTest.group
         expected_object_group = group.title
         self.assertEqual(expected_object_group, str(group))
+
+
+class FollowModelTest(TestCase):
+    def test_follow_is_unique(self):
+        """Подписаться на автора дважды нельзя"""
+        user = User.objects.create_user(username='reader')
+        author = User.objects.create_user(username='writer')
+        Follow.objects.create(user=user, author=author)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(user=user, author=author)
+
+
+class CountersTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(title='Группа', slug='counters')
+        self.other_group = Group.objects.create(title='Другая', slug='other')
+        self.post = Post.objects.create(
+            author=self.author, group=self.group, text='Пост')
+
+    def assert_counters(self, posts, followers, following, comments):
+        stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(stats.posts_count, posts)
+        self.assertEqual(stats.followers_count, followers)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count,
+            following)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, comments)
+
+    def test_counters_follow_changes(self):
+        """Счётчики меняются при создании и удалении объектов"""
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        comment = Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий')
+        self.assert_counters(posts=1, followers=1, following=1, comments=1)
+        self.post.group = self.other_group
+        self.post.save()
+        self.other_group.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(
+            (self.group.posts_count, self.other_group.posts_count), (0, 1))
+        comment.delete()
+        follow.delete()
+        Post.objects.create(author=self.author, text='Второй')
+        self.assert_counters(posts=2, followers=0, following=0, comments=0)
+
+    def test_drifted_counters_do_not_go_negative(self):
+        """Удаление не падает, если счётчик уже разошёлся до нуля"""
+        Comment.objects.create(post=self.post, author=self.reader, text='К')
+        Group.objects.update(posts_count=0)
+        UserStats.objects.update(posts_count=0)
+        Post.objects.update(comments_count=0)
+        Comment.objects.get().delete()
+        self.post.delete()
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 0)
+
+    def test_reconcile_counters_fixes_drift(self):
+        """Команда reconcile_counters исправляет расхождения"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        UserStats.objects.update(posts_count=7, followers_count=0)
+        Group.objects.update(posts_count=5)
+        Post.objects.update(comments_count=3)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assert_counters(posts=1, followers=1, following=1, comments=0)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+
+
+class ImportDataTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        User.objects.create_user(username='old')
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as source:
+            source.write(content)
+        return path
+
+    def test_import_data(self):
+        """import_data загружает записи и пересчитывает производные"""
+        records = [
+            {'type': 'user', 'id': 'u1', 'username': 'writer'},
+            {'type': 'user', 'id': 'u2', 'username': 'old'},
+            {'type': 'group', 'id': 'g1', 'title': 'Группа', 'slug': 'gr'},
+            {'type': 'post', 'id': 'p1', 'author': 'u1', 'group': 'g1',
+             'text': 'Импортированный пост',
+             'pub_date': '2020-01-02T03:04:05'},
+            {'type': 'post', 'id': 'p2', 'author': 'u9', 'text': 'Сирота'},
+            {'type': 'follow', 'user': 'u2', 'author': 'u1'},
+        ]
+        lines = [json.dumps(record) for record in records]
+        data = self.write('data.jsonl', '\n'.join(lines + [
+            'not json', '[1, 2]']))
+        comments = self.write(
+            'comments.csv', 'post,author,text\np1,u2,Комментарий\n')
+        checkpoint = os.path.join(self.directory.name, 'state.sqlite3')
+        errors = StringIO()
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                call_command('import_data', data, comments, batch_size=2,
+                             checkpoint=checkpoint,
+                             stdout=StringIO(), stderr=errors)
+            self.assertFalse([
+                query for query in queries.captured_queries
+                if '"auth_user"."username" =' in query['sql']])
+        for line in ('data.jsonl:5', 'data.jsonl:7', 'data.jsonl:8'):
+            self.assertIn(line, errors.getvalue())
+        self.assertEqual(User.objects.count(), 2)
+        post = Post.objects.get()
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertEqual((post.author.username, post.group.slug),
+                         ('writer', 'gr'))
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(Comment.objects.get().author.username, 'old')
+        self.assertEqual(post.author.stats.followers_count, 1)
+        self.assertEqual(post.group.posts_count, 1)
+        self.assertTrue(Timeline.objects.filter(
+            user__username='old', post=post).exists())
+        posts, _ = search.search_posts('импортирован')
+        self.assertEqual(posts, [post])
+        reader = User.objects.create_user(username='reader')
+        self.assertGreater(reader.pk, post.author_id)
+
+    def test_resume_after_crash(self):
+        """Повтор пачки после сбоя не теряет и не путает записи"""
+        records = [
+            {'type': 'user', 'id': f'u{i}', 'username': f'imp_{i}'}
+            for i in range(6)
+        ] + [
+            {'type': 'post', 'id': f'p{i}', 'author': f'u{i}',
+             'text': f'Пост imp_{i}'}
+            for i in range(6)
+        ] + [{'type': 'post', 'author': 'u0', 'text': 'Пост без id'}]
+        data = self.write('data.jsonl', '\n'.join(map(json.dumps, records)))
+        checkpoint = os.path.join(self.directory.name, 'state.sqlite3')
+        save_progress = Checkpoint.save_progress
+
+        def crash_on(call):
+            # Пачка уже зафиксирована, а строка сохранить не успели.
+            calls = []
+
+            def patched(self, source, line):
+                calls.append(line)
+                if len(calls) == call:
+                    raise RuntimeError('crash')
+                save_progress(self, source, line)
+            return mock.patch.object(Checkpoint, 'save_progress', patched)
+
+        for call in (2, 3):
+            with crash_on(call), self.assertRaises(RuntimeError):
+                call_command('import_data', data, batch_size=2,
+                             checkpoint=checkpoint, stdout=StringIO())
+        call_command('import_data', data, batch_size=2,
+                     checkpoint=checkpoint, stdout=StringIO())
+        self.assertEqual(
+            User.objects.filter(username__startswith='imp_').count(), 6)
+        self.assertEqual(Post.objects.count(), 7)
+        for i in range(6):
+            self.assertEqual(
+                Post.objects.get(text=f'Пост imp_{i}').author.username,
+                f'imp_{i}')
+        self.assertEqual(
+            Post.objects.get(text='Пост без id').author.username, 'imp_0')
@@ -1,17 +1,38 @@
 import datetime
+import json
+import os
 import shutil
 import tempfile
+import threading
+import time
+import zipfile
 from http import HTTPStatus
+from io import BytesIO, StringIO
+from unittest import mock
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.core.management import call_command
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from sorl.thumbnail import get_thumbnail
 
-from ..models import Comment, Follow, Group, Post
+from ..cache import (bump_version, cache_stats, flush_stats,
+                     get_or_compute)
+from ..cards import card_key, render_cards
+from ..counts import ALL, count_for, count_key, reconcile_counters
+from ..models import Comment, Follow, Group, Post, Timeline, UserStats
+from ..notify import notifier
+from ..thumbnails import THUMBNAILS, attach_thumbnails, generate
+from ..timeline import backfill_author, fill_followed, is_pulled
+from ..utils import page_window
+from .utils import QueryBudgetMixin
 
 
 User = get_user_model()
@@ -78,6 +99,7 @@ class PostTests(TestCase):
         cls.output_data = PostTests.post
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.user = User.objects.get(username='test_name2')
         self.authorized_client_2 = Client()
@@ -234,6 +256,34 @@ class PostTests(TestCase):
         self.assertTrue(first_object.text)
 
 
+@override_settings(COMMENTS_LIMIT=2)
+class CommentPagesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user(username='commenter')
+        self.post = Post.objects.create(author=author, text='Обсуждение')
+        self.comments = [
+            Comment.objects.create(post=self.post, author=author,
+                                   text=f'Комментарий {number}').pk
+            for number in range(5)
+        ]
+
+    def test_comments_loaded_by_cursor(self):
+        """Комментарии показываются порциями по курсору (created, id)"""
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk]))
+        seen = [comment.pk for comment in response.context['comments']]
+        cursor = response.context['comments_cursor']
+        url = reverse('posts:post_comments', args=[self.post.pk])
+        while cursor:
+            with self.assertNumQueries(1):
+                response = self.client.get(url, {'cursor': cursor})
+            seen += [comment.pk for comment in response.context['comments']]
+            cursor = response.context['comments_cursor']
+        self.assertEqual(seen, self.comments)
+        self.assertNotContains(response, 'Показать ещё')
+
+
 class PaginatorViewsTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -255,8 +305,11 @@ class PaginatorViewsTest(TestCase):
             )
             )
         Post.objects.bulk_create(cls.posts)
+        # bulk_create не отправляет сигналы, счётчики сверяем вручную.
+        reconcile_counters()
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
 
     def test_first_page_contains_ten_posts(self):
@@ -289,6 +342,128 @@ class PaginatorViewsTest(TestCase):
                 TEMP_DUMB_SECOND_PAGE
             )
 
+    def test_cursor_pages_walk_whole_feed(self):
+        """По курсорам листаются все посты без повторов и пропусков"""
+        list_urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test_slug2'}),
+            reverse('posts:profile', kwargs={'username': 'test_name'}),
+        )
+        for tested_url in list_urls:
+            with self.subTest(url=tested_url):
+                cache.clear()
+                page_obj = self.guest_client.get(
+                    tested_url).context['page_obj']
+                seen = list(page_obj)
+                while page_obj.has_next():
+                    page_obj = self.guest_client.get(
+                        tested_url,
+                        {'cursor': str(page_obj.next_cursor)}
+                    ).context['page_obj']
+                    seen.extend(page_obj)
+                self.assertEqual(len(seen), OPTIONAL_PAGE_RANGE)
+                self.assertEqual(len(set(seen)), OPTIONAL_PAGE_RANGE)
+                previous = self.guest_client.get(
+                    tested_url,
+                    {'cursor': str(page_obj.previous_cursor)}
+                ).context['page_obj']
+                self.assertEqual(list(previous), seen[:TEMP_DUMB_FIRST_PAGE])
+                self.assertFalse(previous.has_previous())
+
+    def test_counts_maintained_without_count_query(self):
+        """Число постов в ленте берётся из кэша и обновляется сигналами"""
+        self.guest_client.get(reverse('posts:index'))
+        post = Post.objects.create(
+            text='Ещё пост', author=self.author, group=self.group)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                count_for(count_key(ALL), Post.objects.none()),
+                OPTIONAL_PAGE_RANGE + 1
+            )
+        post.delete()
+        self.assertEqual(
+            count_for(count_key(ALL), Post.objects.none()),
+            OPTIONAL_PAGE_RANGE
+        )
+
+    def test_last_page_linked_by_cursor(self):
+        """Номер последней страницы ведёт на курсор, а не на OFFSET"""
+        response = self.guest_client.get(reverse('posts:index'))
+        last_cursor = response.context['page_obj'].last_cursor
+        self.assertNotContains(response, 'href="?page=2"')
+        self.assertContains(
+            response, f'href="?cursor={last_cursor}">2</a>')
+
+    def test_broken_cursor_opens_first_page(self):
+        response = self.guest_client.get(
+            reverse('posts:index'), {'cursor': '!!!'})
+        self.assertEqual(response.context['page_obj'].number, 1)
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(title='Группа', slug='budget')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.post = self.add_post(self.author)
+        self.client.force_login(self.reader)
+
+    def add_post(self, author):
+        post = Post.objects.create(
+            author=author, group=self.group, text='Пост для подсчёта')
+        Comment.objects.create(post=post, author=author, text='Комментарий')
+        return post
+
+    def grow(self):
+        for i in range(TEMP_DUMB_FIRST_PAGE):
+            author = User.objects.create_user(username=f'author_{i}')
+            Follow.objects.create(user=self.reader, author=author)
+            self.add_post(author)
+            self.add_post(self.author)
+            Comment.objects.create(post=self.post, author=author, text='Ещё')
+
+    def test_queries_do_not_grow_with_page_size(self):
+        """Число запросов страниц не зависит от числа постов на них"""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'budget'}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+        self.assertQueryBudget(self.client, urls, self.grow)
+
+    def test_admin_queries_do_not_grow(self):
+        """Списки админки не делают запросов на каждую строку"""
+        self.client.force_login(User.objects.create_superuser(
+            'admin', 'admin@mail.ru', 'pass'))
+        urls = (
+            reverse('admin:posts_post_changelist'),
+            reverse('admin:posts_comment_changelist'),
+            reverse('admin:posts_follow_changelist'),
+            reverse('admin:posts_follow_changelist') + '?author=author',
+        )
+        self.assertQueryBudget(self.client, urls, self.grow)
+
+
+class PageWindowTest(SimpleTestCase):
+    def test_window_keeps_size_on_large_feeds(self):
+        """Навигация содержит крайние страницы, соседей и пропуски"""
+        paginator = Paginator(range(100000), settings.POSTS_LIMIT)
+        cases = {
+            1: [1, 2, 3, None, 10000],
+            5: [1, 2, 3, 4, 5, 6, 7, None, 10000],
+            5000: [1, None, 4998, 4999, 5000, 5001, 5002, None, 10000],
+            10000: [1, None, 9998, 9999, 10000],
+        }
+        for number, expected in cases.items():
+            with self.subTest(number=number):
+                self.assertEqual(
+                    page_window(paginator.page(number), neighbours=2),
+                    expected
+                )
+
 
 class CacheTests(TestCase):
     @classmethod
@@ -301,6 +476,7 @@ class CacheTests(TestCase):
             text='Тестовая запись для создания поста')
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.post.author)
@@ -308,18 +484,325 @@ class CacheTests(TestCase):
     def test_cache_index(self):
         """Тест кэширования страницы index.html"""
         first_state = self.authorized_client.get(reverse('posts:index'))
-        post = Post.objects.get(pk=1)
-        post.text = 'Измененный текст'
-        post.save()
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
         second_state = self.authorized_client.get(reverse('posts:index'))
         self.assertEqual(first_state.content, second_state.content)
         cache.clear()
         third_state = self.authorized_client.get(reverse('posts:index'))
         self.assertNotEqual(first_state.content, third_state.content)
 
+    def test_cache_index_invalidated_on_change(self):
+        """Изменение поста сразу сбрасывает кэш ленты"""
+        first_state = self.authorized_client.get(reverse('posts:index'))
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Измененный текст'
+        post.save()
+        second_state = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotEqual(first_state.content, second_state.content)
+        self.assertContains(second_state, 'Измененный текст')
+
+    def test_cache_index_varies_by_page_and_auth(self):
+        """Страницы ленты и гости кэшируются под разными ключами"""
+        Post.objects.bulk_create(
+            Post(author=self.post.author, text=f'Пост {i}')
+            for i in range(TEMP_DUMB_FIRST_PAGE)
+        )
+        reconcile_counters()
+        bump_version()
+        first_page = self.authorized_client.get(reverse('posts:index'))
+        second_page = self.authorized_client.get(
+            reverse('posts:index'), {'page': 2})
+        self.assertNotEqual(first_page.content, second_page.content)
+        self.assertContains(second_page, self.post.text)
+        guest_page = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(guest_page, 'Войти')
+
+    def test_stale_fragment_served_while_recomputing(self):
+        """Пока значение пересчитывается, остальные получают старое"""
+        flush_stats()
+        cache.clear()
+        key = 'posts:fragment:test'
+        get_or_compute(key, lambda: 'старое', 60, version=1)
+        self.assertEqual(
+            get_or_compute(key, lambda: 'новое', 60, version=1), 'старое')
+        cache.add(f'{key}:lock', 1, 30)
+        self.assertEqual(
+            get_or_compute(key, lambda: 'новое', 60, version=2), 'старое')
+        cache.delete(f'{key}:lock')
+        self.assertEqual(
+            get_or_compute(key, lambda: 'новое', 60, version=2), 'новое')
+        self.assertEqual(cache_stats(), {'hit': 1, 'miss': 2, 'stale': 1})
+
+    @override_settings(FEED_CACHE_LOCK_WAIT=0.5)
+    def test_missing_fragment_waits_for_recompute(self):
+        """Без значения в кэше запрос ждёт чужой пересчёт, а не считает сам"""
+        key = 'posts:fragment:wait'
+        cache.add(f'{key}:lock', 1, 30)
+        timer = threading.Timer(0.1, lambda: cache.set(
+            key, ('готовое', None, 0, time.time() + 60), 60))
+        timer.start()
+
+        def compute():
+            raise AssertionError('пересчёт не нужен')
+        self.assertEqual(get_or_compute(key, compute, 60), 'готовое')
+        timer.join()
+        cache.delete(key)
+        self.assertEqual(get_or_compute(key, lambda: 'своё', 60), 'своё')
+
+    @override_settings(FEED_CACHE_STATS_INTERVAL=3600)
+    def test_stats_counted_in_process(self):
+        """Попадания не пишутся в кэш на каждом запросе"""
+        flush_stats()
+        cache.clear()
+        get_or_compute('posts:fragment:stats', lambda: 'x', 60)
+        get_or_compute('posts:fragment:stats', lambda: 'x', 60)
+        self.assertIsNone(cache.get('posts:cache:miss'))
+        self.assertEqual(cache_stats()['miss'], 1)
+        self.assertEqual(cache.get('posts:cache:miss'), 1)
+
+    def test_anonymous_page_conditional_get(self):
+        """Гость получает 304 по ETag без запросов к базе"""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.guest_client.get(url)
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Новый текст для гостей'
+        post.save()
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Новый текст для гостей')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_anonymous_profile_sees_new_follower(self):
+        """Подписка сбрасывает закэшированный профиль для гостей"""
+        url = reverse('posts:profile', args=[self.post.author.username])
+        etag = self.guest_client.get(url)['ETag']
+        reader = User.objects.create_user(username='new_follower')
+        Follow.objects.create(user=reader, author=self.post.author)
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.context['follow_count'], 1)
+
+    def test_authorized_page_not_cached(self):
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('ETag'))
+
+
+class FeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='feeder')
+        self.group = Group.objects.create(
+            title='Лента', slug='feed', description='Описание')
+        Post.objects.create(author=self.author, group=self.group,
+                            text='Пост для читалок')
+        Post.objects.create(author=self.author, text='Без группы')
+
+    def test_feeds_list_posts(self):
+        """RSS и Atom отдают посты ленты, группы и автора"""
+        cases = (
+            ('posts:index_rss', (), 'application/rss+xml', 2),
+            ('posts:index_atom', (), 'application/atom+xml', 2),
+            ('posts:group_rss', (self.group.slug,), 'application/rss+xml',
+             1),
+            ('posts:profile_atom', (self.author.username,),
+             'application/atom+xml', 2),
+        )
+        for name, args, content_type, count in cases:
+            with self.subTest(name=name):
+                response = self.client.get(reverse(name, args=args))
+                self.assertTrue(response['Content-Type'].startswith(
+                    content_type))
+                self.assertContains(response, 'Пост для читалок')
+                tag = b'<item>' if 'rss' in content_type else b'<entry>'
+                self.assertEqual(response.content.count(tag), count)
+        response = self.client.get(reverse('posts:group_rss', args=['no']))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_feed_conditional_get(self):
+        """Повторный опрос ленты получает 304 без запросов к базе"""
+        url = reverse('posts:group_atom', args=[self.group.slug])
+        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag'],
+                HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='api_author')
+        self.reader = User.objects.create_user(username='api_reader')
+        self.group = Group.objects.create(title='API', slug='api')
+        start = datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc)
+        for number in range(7):
+            post = Post.objects.create(
+                author=self.author, text=f'Пост {number}',
+                group=self.group if number % 2 else None)
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=start + datetime.timedelta(days=number % 3))
+        Comment.objects.create(post=post, author=self.reader, text='Ответ')
+
+    def walk(self, url, queries=1, **params):
+        ids, cursor = [], ''
+        while cursor is not None:
+            with self.assertNumQueries(queries):
+                data = self.client.get(
+                    url, {'limit': 3, 'cursor': cursor, **params}).json()
+            ids += [row['id'] for row in data['results']]
+            cursor = data['next']
+        return ids
+
+    def test_cursor_pages_follow_feed_order(self):
+        """Страницы API идут по курсору в порядке ленты"""
+        expected = list(Post.objects.values_list('id', flat=True))
+        self.assertEqual(self.walk(reverse('posts:api_posts')), expected)
+        self.assertEqual(
+            self.walk(reverse('posts:api_group_posts', args=['api']),
+                      queries=2),
+            list(self.group.posts.values_list('id', flat=True)))
+
+    def test_sparse_fields(self):
+        """fields= оставляет в ответе только запрошенные поля"""
+        url = reverse('posts:api_posts')
+        data = self.client.get(url, {'fields': 'id,author'}).json()
+        self.assertEqual(set(data['results'][0]), {'id', 'author'})
+        self.assertEqual(data['results'][0]['author'], 'api_author')
+        response = self.client.get(url, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        response = self.client.get(
+            reverse('posts:api_group_posts', args=['missing']))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        post = Comment.objects.get().post
+        data = self.client.get(
+            reverse('posts:api_post_comments', args=[post.pk]),
+            {'fields': 'text'}).json()
+        self.assertEqual(data['results'], [{'text': 'Ответ'}])
+
+    def test_follow_feed(self):
+        """Лента подписок в API доступна только после входа"""
+        url = reverse('posts:api_follow')
+        self.assertEqual(self.client.get(url).status_code,
+                         HTTPStatus.UNAUTHORIZED)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client.force_login(self.reader)
+        UserStats.objects.filter(user=self.author).update(feed_pulled=True)
+        pulled = self.walk(url, queries=6)
+        UserStats.objects.filter(user=self.author).update(feed_pulled=False)
+        self.assertEqual(self.walk(url, queries=5), pulled)
+        self.assertEqual(
+            pulled, list(Post.objects.values_list('id', flat=True)))
+
+
+class UpdatesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        notifier.publish()
+        self.author = User.objects.create_user(username='notifier')
+        self.group = Group.objects.create(title='Новости', slug='news')
+        self.seen = Post.objects.create(author=self.author, text='Старый')
+        self.url = reverse('posts:updates')
+
+    def updates(self, headers=None, **params):
+        return self.client.get(self.url, {'since': self.seen.pk, **params},
+                               **(headers or {}))
+
+    def test_counts_newer_posts(self):
+        """Число новых постов считается по ленте, группе и подпискам"""
+        self.assertEqual(self.updates().json()['count'], 0)
+        Post.objects.create(author=self.author, text='Новый')
+        newest = Post.objects.create(
+            author=self.author, group=self.group, text='В группе')
+        self.assertEqual(self.updates().json(),
+                         {'count': 2, 'latest': newest.pk})
+        self.assertEqual(self.updates(group='news').json()['count'], 1)
+        self.assertEqual(self.updates(feed='follow').status_code,
+                         HTTPStatus.UNAUTHORIZED)
+        reader = User.objects.create_user(username='listener')
+        Follow.objects.create(user=reader, author=self.author)
+        self.client.force_login(reader)
+        self.assertEqual(self.updates(feed='follow').json()['count'], 2)
+
+    @override_settings(NOTIFY_POLL_INTERVAL=60)
+    def test_idle_client_woken_by_publish(self):
+        """Ждущий клиент не опрашивает базу и просыпается от publish"""
+        notifier.state('all', self.seen.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                notifier.wait('all', self.seen.pk, 0.05), self.seen.pk)
+        # bulk_create не шлёт сигналов: о посте узнают только из publish.
+        Post.objects.bulk_create([Post(author=self.author, text='Новый')])
+        timer = threading.Timer(0.05, notifier.publish)
+        timer.start()
+        started = time.monotonic()
+        self.assertEqual(notifier.wait('all', self.seen.pk, 30),
+                         Post.objects.latest('id').pk)
+        self.assertLess(time.monotonic() - started, 30)
+        timer.join()
+
+    def test_query_runs_without_lock(self):
+        """Запрос к базе не держит блокировку, на которой ждут клиенты"""
+        free = []
+
+        def posts(scope):
+            probe = threading.Thread(target=lambda: free.append(
+                notifier.condition.acquire(blocking=False)
+                and notifier.condition.release() is None))
+            probe.start()
+            probe.join()
+            return Post.objects.all()
+        with mock.patch('posts.notify._posts', posts):
+            notifier.state('all', self.seen.pk)
+        self.assertEqual(free, [True])
+
+    @override_settings(NOTIFY_STREAM_DURATION=0.1, NOTIFY_HEARTBEAT=0.05)
+    def test_event_stream(self):
+        """Поток событий сообщает о новых постах"""
+        newest = Post.objects.create(author=self.author, text='Новый')
+        response = self.updates({'HTTP_ACCEPT': 'text/event-stream'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn(f'id: {newest.pk}\nevent: posts\n', content)
+        self.assertIn('"count": 1', content)
+        self.assertIn(': ping', content)
+
+
+class CardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='carder')
+        self.group = Group.objects.create(title='Карточки', slug='cards')
+        self.edited, self.kept = (
+            Post.objects.create(author=self.author, group=self.group,
+                                text=f'Карточка {number}')
+            for number in range(2)
+        )
+
+    def test_cards_shared_between_listings(self):
+        """Карточка рендерится один раз и переиспользуется всеми лентами"""
+        self.client.get(reverse('posts:group_list', args=['cards']))
+        cache.set(card_key(self.kept), '<p>Из кэша</p>')
+        self.edited.text = 'Исправленный текст'
+        self.edited.save()
+        for url in (reverse('posts:index'),
+                    reverse('posts:profile', args=['carder'])):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, 'Из кэша')
+                self.assertContains(response, 'Исправленный текст')
+                self.assertNotContains(response, 'Карточка 1')
+
 
 class FollowTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.user_follower = User.objects.create_user(
             username='follower',
             email='test_11@mail.ru',
@@ -377,3 +860,360 @@ class FollowTests(TestCase):
             response,
             'Тестовая запись для тестирования ленты'
         )
+
+    def test_timeline_filled_on_post_create(self):
+        """Новый пост автора раскладывается в ленты подписчиков"""
+        Follow.objects.create(user=self.user_follower,
+                              author=self.user_following)
+        post = Post.objects.create(
+            author=self.user_following,
+            text='Свежая запись для ленты'
+        )
+        self.assertTrue(Timeline.objects.filter(
+            user=self.user_follower, post=post).exists())
+        self.assertFalse(Timeline.objects.filter(
+            user=self.user_following).exists())
+
+    def test_timeline_cleaned_on_unfollow(self):
+        """После отписки посты автора уходят из ленты"""
+        self.client_auth_follower.get(reverse(
+            'posts:profile_follow',
+            kwargs={'username': self.user_following.username})
+        )
+        self.assertEqual(
+            Timeline.objects.filter(user=self.user_follower).count(), 1)
+        self.client_auth_follower.get(reverse(
+            'posts:profile_unfollow',
+            kwargs={'username': self.user_following.username})
+        )
+        self.assertFalse(
+            Timeline.objects.filter(user=self.user_follower).exists())
+
+    def test_rebuild_timelines_command(self):
+        """Команда rebuild_timelines восстанавливает ленты"""
+        Follow.objects.create(user=self.user_follower,
+                              author=self.user_following)
+        Timeline.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        response = self.client_auth_follower.get(
+            reverse('posts:follow_index')
+        )
+        self.assertEqual(len(response.context['page_obj']), 1)
+
+    def test_hybrid_feed_merges_pulled_authors(self):
+        """Посты популярных авторов читаются в ленту без раскладки"""
+        pushed_author = User.objects.create_user(username='pushed')
+        Follow.objects.create(user=self.user_follower,
+                              author=pushed_author)
+        with self.settings(FEED_PULL_THRESHOLD=1):
+            Follow.objects.create(user=pushed_author,
+                                  author=self.user_following)
+            Follow.objects.create(user=self.user_follower,
+                                  author=self.user_following)
+            Post.objects.create(author=pushed_author, text='Обычный автор')
+            Post.objects.create(author=self.user_following,
+                                text='Популярный автор')
+            self.assertFalse(Timeline.objects.filter(
+                author=self.user_following).exclude(
+                    post=self.post).exists())
+            response = self.client_auth_follower.get(
+                reverse('posts:follow_index')
+            )
+        texts = [post.text for post in response.context['page_obj']]
+        self.assertEqual(texts, [
+            'Популярный автор',
+            'Обычный автор',
+            'Тестовая запись для тестирования ленты',
+        ])
+
+    def test_follow_feed_count_follows_changes(self):
+        """Число постов ленты подписок верно после удаления и переключения"""
+        Follow.objects.create(user=self.user_follower,
+                              author=self.user_following)
+        posts = [Post.objects.create(author=self.user_following,
+                                     text=f'Пост {number}')
+                 for number in range(4)]
+        url = reverse('posts:follow_index')
+
+        def count():
+            response = self.client_auth_follower.get(url)
+            return response.context['page_obj'].paginator.count
+        self.assertEqual(count(), 5)
+        for post in posts[:2]:
+            post.delete()
+        self.assertEqual(count(), 3)
+        with self.settings(FEED_PULL_THRESHOLD=1):
+            Follow.objects.create(user=self.user_following,
+                                  author=self.user_following)
+            self.assertTrue(is_pulled(self.user_following.pk))
+            self.assertEqual(count(), 3)
+            with CaptureQueriesContext(connection) as queries:
+                posts[2].delete()
+            self.assertFalse([query for query in queries.captured_queries
+                              if 'posts_follow' in query['sql']])
+            self.assertEqual(count(), 2)
+
+    @override_settings(TIMELINE_FOLLOW_LIMIT=2)
+    def test_follow_fills_recent_posts_first(self):
+        """При подписке сразу переносятся только свежие посты автора"""
+        newer = [Post.objects.create(author=self.user_following,
+                                     text=f'Пост {number}')
+                 for number in range(2)]
+        Follow.objects.create(user=self.user_follower,
+                              author=self.user_following)
+        entries = Timeline.objects.filter(user=self.user_follower)
+        self.assertEqual(set(entries.values_list('post', flat=True)),
+                         {post.pk for post in newer})
+        fill_followed(self.user_follower.pk, self.user_following.pk)
+        self.assertEqual(entries.count(), 3)
+        Follow.objects.all().delete()
+        fill_followed(self.user_follower.pk, self.user_following.pk)
+        self.assertFalse(entries.exists())
+
+    @override_settings(FEED_PULL_THRESHOLD=2, FEED_PUSH_THRESHOLD=1)
+    def test_pull_state_hysteresis(self):
+        """Автор у порога не переключается на каждой подписке и отписке"""
+        author = self.user_following
+        readers = [self.user_follower] + [
+            User.objects.create_user(username=f'reader{number}')
+            for number in range(2)
+        ]
+        for reader in readers:
+            Follow.objects.create(user=reader, author=author)
+        self.assertTrue(is_pulled(author.pk))
+        Follow.objects.filter(user=readers[2]).delete()
+        self.assertTrue(is_pulled(author.pk))
+        post = Post.objects.create(author=author, text='Пока популярен')
+        Follow.objects.filter(user=readers[1]).delete()
+        self.assertFalse(is_pulled(author.pk))
+        backfill_author(author.pk)
+        self.assertTrue(Timeline.objects.filter(
+            user=self.user_follower, post=post).exists())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        cls.post = Post.objects.create(
+            author=User.objects.create_user(username='test_name'),
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(name='thumb.gif', content=small_gif,
+                                     content_type='image/gif'),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def sorl_url(self, alias):
+        geometry, options = THUMBNAILS[alias]
+        return get_thumbnail(self.post.image.name, geometry, **options).url
+
+    def attached(self, alias):
+        post = Post.objects.get(pk=self.post.pk)
+        attach_thumbnails([post], alias)
+        return post.thumbnail
+
+    def test_original_until_thumbnail_ready(self):
+        """Пока миниатюры нет, страница показывает исходную картинку."""
+        image = self.post.image
+        self.assertEqual(self.attached('card'), image.url)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, f'src="{image.url}"')
+        etag = response['ETag']
+        generate(image.name)
+        for alias in THUMBNAILS:
+            with self.subTest(alias=alias):
+                self.assertEqual(self.attached(alias), self.sorl_url(alias))
+                self.assertNotEqual(self.attached(alias), image.url)
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, f'src="{self.sorl_url("card")}"')
+        generate(image.name)
+        self.assertEqual(
+            self.client.get(reverse('posts:index'))['ETag'],
+            response['ETag'])
+
+    def test_page_resolved_in_one_query(self):
+        """URL миниатюр страницы берутся из kvstore одним запросом."""
+        generate(self.post.image.name)
+        posts = [self.post] + [
+            Post.objects.create(author=self.post.author, text=str(number),
+                                image=self.post.image)
+            for number in range(3)
+        ]
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            attach_thumbnails(posts, 'card')
+        self.assertEqual(len(queries), 1)
+        expected = self.sorl_url('card')
+        self.assertNotEqual(expected, self.post.image.url)
+        for post in posts:
+            self.assertEqual(post.thumbnail, expected)
+            self.assertIn('.webp 480w', post.thumbnail_webp_srcset)
+            self.assertIn(f'{expected} 960w', post.thumbnail_srcset)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, f'src="{expected}"', count=4)
+
+    def test_card_cached_when_variants_ready(self):
+        """Карточка без всех вариантов srcset не кэшируется."""
+        self.sorl_url('card')
+        post = Post.objects.get(pk=self.post.pk)
+        render_cards([post])
+        self.assertNotEqual(post.thumbnail, post.image.url)
+        self.assertIsNone(cache.get(card_key(post)))
+        generate(post.image.name)
+        render_cards([post])
+        self.assertIn('.webp 1440w', cache.get(card_key(post)))
+
+    def test_missing_file_skipped(self):
+        """Картинка без файла не ломает фоновую обработку."""
+        generate('posts/missing.gif')
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='searcher')
+        cls.post = Post.objects.create(
+            author=cls.user, text='Кофе по утрам и кофе вечером')
+        Post.objects.create(author=cls.user, text='Утро без кофейни')
+        Post.objects.create(author=cls.user, text='Про чай')
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query, cursor=''):
+        response = self.client.get(reverse('posts:search'),
+                                   {'q': query, 'cursor': cursor})
+        return response, [post.text for post in response.context['posts']]
+
+    def test_ranked_prefix_search(self):
+        """Слова ищутся по началу, лучшее совпадение первым."""
+        _, texts = self.search('КОФЕ')
+        self.assertEqual(texts, ['Кофе по утрам и кофе вечером',
+                                 'Утро без кофейни'])
+        _, texts = self.search('кофе утр')
+        self.assertEqual(len(texts), 2)
+        _, texts = self.search('!!!')
+        self.assertEqual(texts, [])
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется при изменении и удалении поста."""
+        self.post.text = 'Теперь про какао'
+        self.post.save()
+        self.assertEqual(self.search('какао')[1], ['Теперь про какао'])
+        self.assertEqual(self.search('кофе')[1], ['Утро без кофейни'])
+        self.post.delete()
+        self.assertEqual(self.search('какао')[1], [])
+
+    def test_cursor_pages(self):
+        """Курсор ведёт на следующую страницу без повторов."""
+        for number in range(3):
+            Post.objects.create(author=self.user, text=f'кофе {number}')
+        with self.settings(SEARCH_LIMIT=2):
+            seen = []
+            cursor = ''
+            for _ in range(3):
+                response, texts = self.search('кофе', cursor)
+                seen += texts
+                cursor = response.context['next_cursor']
+                if cursor is None:
+                    break
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_admin_uses_index(self):
+        """Поиск в админке находит посты через индекс."""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@mail.ru', 'pass')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'кофе'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_admin_comment_and_follow_search(self):
+        """Комментарии ищутся по автору и тексту, подписки по именам."""
+        reader = User.objects.create_user(username='reader')
+        Comment.objects.create(post=self.post, author=reader, text='Ого')
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Отличный кофе')
+        Follow.objects.create(user=reader, author=self.post.author)
+        self.client.force_login(User.objects.create_superuser(
+            'admin', 'admin@mail.ru', 'pass'))
+        cases = (
+            ('admin:posts_comment_changelist', 'read', 1),
+            ('admin:posts_comment_changelist', 'кофе', 1),
+            ('admin:posts_comment_changelist', 'sea', 1),
+            ('admin:posts_comment_changelist', 'nobody', 0),
+            ('admin:posts_follow_changelist', 'rea', 1),
+            ('admin:posts_follow_changelist', 'search', 1),
+            ('admin:posts_follow_changelist', 'ead', 0),
+        )
+        for url, query, expected in cases:
+            with self.subTest(url=url, query=query):
+                response = self.client.get(reverse(url), {'q': query})
+                self.assertEqual(
+                    response.context['cl'].result_count, expected)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, EXPORT_CHUNK_SIZE=2)
+class ExportTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='exporter')
+        self.other = User.objects.create_user(username='other')
+        group = Group.objects.create(title='Группа', slug='export')
+        for number in range(3):
+            Post.objects.create(author=self.user, group=group,
+                                text=f'Пост {number}')
+        post = Post.objects.create(author=self.other, text='Чужой')
+        Comment.objects.create(post=post, author=self.user, text='Ответ')
+        Follow.objects.create(user=self.user, author=self.other)
+        self.url = reverse('posts:profile_export', args=[self.user])
+        self.client.force_login(self.user)
+
+    def kinds(self, content):
+        return [json.loads(line)['type']
+                for line in content.decode().splitlines()]
+
+    def test_export_streams_jsonl_and_zip(self):
+        """Выгрузка отдаётся потоком в jsonl и в zip"""
+        response = self.client.get(self.url)
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content)
+        expected = ['user', 'group'] + ['post'] * 3 + ['comment', 'follow']
+        self.assertEqual(self.kinds(content), expected)
+        response = self.client.get(self.url, {'format': 'zip'})
+        archive = zipfile.ZipFile(
+            BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(self.kinds(archive.read('data.jsonl')), expected)
+        output = os.path.join(MEDIA_ROOT, 'export.jsonl')
+        call_command('export_user', 'exporter', output=output)
+        with open(output, 'rb') as exported:
+            self.assertEqual(exported.read(), content)
+
+    def test_export_only_for_owner(self):
+        """Чужие данные выгрузить нельзя"""
+        self.client.force_login(self.other)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, HTTPStatus.FORBIDDEN)
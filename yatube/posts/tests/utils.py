@@ -0,0 +1,28 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """
+    Проверка, что число запросов страницы не растёт вместе
+    с количеством объектов на ней.
+    """
+
+    def count_queries(self, client, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            client.get(url)
+        return len(context)
+
+    def assertQueryBudget(self, client, urls, grow):
+        """grow() добавляет объекты, которые попадут на те же страницы."""
+        before = [self.count_queries(client, url) for url in urls]
+        grow()
+        after = [self.count_queries(client, url) for url in urls]
+        for url, expected, actual in zip(urls, before, after):
+            with self.subTest(url=url):
+                self.assertEqual(
+                    expected, actual,
+                    f'{url}: число запросов выросло с {expected} до {actual}'
+                )
@@ -0,0 +1,163 @@
+from django.core.files.storage import default_storage
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDBStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import background
+from .cache import bump_version
+
+# Размеры, в которых шаблоны показывают картинки постов.
+THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+    'detail': ('1980x1080', {'crop': 'center', 'upscale': False}),
+}
+
+# Ширины вариантов для srcset: те же пропорции, что у основной миниатюры.
+VARIANT_WIDTHS = {
+    'card': (480, 960, 1440),
+    'detail': (960, 1980),
+}
+VARIANT_FORMATS = ('JPEG', 'WEBP')
+
+
+def _thumbnail_options(backend, source, options):
+    # Те же умолчания, что подставляет ThumbnailBackend.get_thumbnail:
+    # от них зависит имя файла миниатюры.
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def _file(name, geometry, options):
+    backend = default.backend
+    source = ImageFile(name)
+    filename = backend._get_thumbnail_filename(
+        source, geometry, _thumbnail_options(backend, source, options))
+    return ImageFile(filename, default.storage)
+
+
+def variants(alias):
+    """(ширина, формат, геометрия, опции) всех вариантов миниатюры."""
+    geometry, options = THUMBNAILS[alias]
+    width, height = map(int, geometry.split('x'))
+    for variant_width in VARIANT_WIDTHS[alias]:
+        variant_height = round(height * variant_width / width)
+        for image_format in VARIANT_FORMATS:
+            yield (
+                variant_width,
+                image_format,
+                f'{variant_width}x{variant_height}',
+                {**options, 'format': image_format},
+            )
+
+
+def thumbnail_file(name, alias):
+    """Файл миниатюры, под которым sorl хранит её в kvstore."""
+    return _file(name, *THUMBNAILS[alias])
+
+
+def _raw_values(keys):
+    # То же, что cached_db KVStore._get_raw, но для всех ключей сразу:
+    # один get_many к кэшу и один запрос к таблице на промахи.
+    store = default.kvstore
+    values = store.cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(KVStoreModel.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        fetched = {key: found.get(key, EMPTY_VALUE) for key in missing}
+        store.cache.set_many(fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(fetched)
+    return {key: value for key, value in values.items()
+            if value is not EMPTY_VALUE}
+
+
+def _ready_urls(files):
+    """URL тех миниатюр из files, что уже созданы, по ключу файла."""
+    if not isinstance(default.kvstore, CachedDBStore):
+        found = (default.kvstore.get(file) for file in files)
+        return {file.key: file.url for file in found if file}
+    keys = {add_prefix(file.key): file.key for file in files}
+    return {
+        keys[key]: deserialize_image_file(value).url
+        for key, value in _raw_values(list(keys)).items()
+    }
+
+
+def _srcset(urls, candidates):
+    return ', '.join(f'{urls[key]} {width}w'
+                     for width, key in candidates if key in urls)
+
+
+def attach_thumbnails(posts, alias):
+    """
+    Записывает в post.thumbnail URL миниатюры для каждого поста с
+    картинкой, а в post.thumbnail_srcset и post.thumbnail_webp_srcset —
+    готовые варианты разной ширины. Всё берётся из kvstore одним
+    запросом на страницу. Где миниатюры ещё нет, остаётся URL исходной
+    картинки и пустой srcset; post.thumbnails_ready истинно, только
+    когда созданы основная миниатюра и все её варианты.
+    """
+    posts = [post for post in posts if post.image]
+    files = {}
+    for post in posts:
+        name = post.image.name
+        files[(name, None, None)] = thumbnail_file(name, alias)
+        for width, image_format, geometry, options in variants(alias):
+            files[(name, width, image_format)] = _file(
+                name, geometry, options)
+    urls = _ready_urls(list(files.values()))
+    for post in posts:
+        name = post.image.name
+        post.thumbnails_ready = all(
+            file.key in urls for key, file in files.items()
+            if key[0] == name)
+        post.thumbnail = urls.get(
+            files[(name, None, None)].key, post.image.url)
+        for image_format, attr in (('JPEG', 'thumbnail_srcset'),
+                                   ('WEBP', 'thumbnail_webp_srcset')):
+            setattr(post, attr, _srcset(urls, [
+                (width, files[(name, width, image_format)].key)
+                for width in VARIANT_WIDTHS[alias]
+            ]))
+    return posts
+
+
+def generate(name):
+    """
+    Создаёт все миниатюры картинки и их варианты для srcset. Если
+    что-то было создано, сбрасывает кэш страниц и фрагментов: в них
+    ещё ссылка на исходную картинку.
+    """
+    if not default_storage.exists(name):
+        return
+    files = {}
+    for alias in THUMBNAILS:
+        for file in [thumbnail_file(name, alias)] + [
+                _file(name, geometry, options)
+                for _, _, geometry, options in variants(alias)]:
+            files[file.key] = file
+    if len(_ready_urls(list(files.values()))) == len(files):
+        return
+    for alias, (geometry, options) in THUMBNAILS.items():
+        get_thumbnail(name, geometry, **options)
+        for _, _, variant_geometry, variant_options in variants(alias):
+            get_thumbnail(name, variant_geometry, **variant_options)
+    bump_version()
+
+
+def schedule(name):
+    """Ставит создание миниатюр картинки в пул фоновых задач."""
+    background.submit(generate, name)
@@ -0,0 +1,263 @@
+import heapq
+
+from django.conf import settings
+from django.db import transaction
+
+from . import background, counts
+from .models import Follow, Post, Timeline, UserStats
+from .utils import merge_seek, seek_queryset
+
+
+def _entries(user_ids, posts):
+    return [
+        Timeline(user_id=user_id, post_id=post.pk,
+                 author_id=post.author_id, pub_date=post.pub_date)
+        for user_id in user_ids
+        for post in posts
+    ]
+
+
+def _bulk_insert(entries):
+    Timeline.objects.bulk_create(
+        entries,
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def is_pulled(author_id):
+    """Посты популярных авторов читаются при открытии ленты."""
+    return UserStats.objects.filter(
+        user_id=author_id, feed_pulled=True).exists()
+
+
+def pulled_authors(user):
+    """id популярных авторов, на которых подписан пользователь."""
+    return list(Follow.objects.filter(
+        user=user, author__stats__feed_pulled=True,
+    ).values_list('author_id', flat=True))
+
+
+def update_pull_state(author_id):
+    """
+    Переключает автора между раздачей постов по лентам и чтением при
+    открытии ленты. Порогов два (FEED_PULL_THRESHOLD и
+    FEED_PUSH_THRESHOLD), чтобы автор у границы не переключался на
+    каждой подписке и отписке. Раскладка постов после переключения
+    обратно идёт в фоне, а не в запросе отписавшегося.
+    """
+    stats = UserStats.objects.filter(user_id=author_id)
+    state = stats.values('feed_pulled', 'followers_count').first()
+    if state is None:
+        return
+    # Закэшированные числа постов лент сбрасывать не нужно: они
+    # хранятся вместе с набором популярных авторов (TimelineFeed.count).
+    if (not state['feed_pulled']
+            and state['followers_count'] > settings.FEED_PULL_THRESHOLD):
+        stats.update(feed_pulled=True)
+    elif (state['feed_pulled']
+            and state['followers_count'] <= settings.FEED_PUSH_THRESHOLD):
+        stats.update(feed_pulled=False)
+        transaction.on_commit(
+            lambda: background.submit(backfill_author, author_id))
+
+
+def backfill_author(author_id):
+    """Раскладывает посты автора, переставшего быть популярным."""
+    if is_pulled(author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)
+    for follower_id in followers.iterator():
+        fill_timeline(follower_id, author_id)
+
+
+def push_post(post):
+    """Раскладываем новый пост в ленты всех подписчиков автора."""
+    if is_pulled(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    batch = []
+    for user_id in followers.iterator():
+        batch.append(user_id)
+        if len(batch) >= settings.TIMELINE_BATCH_SIZE:
+            _bulk_insert(_entries(batch, [post]))
+            counts.follow_feeds_changed(batch)
+            batch = []
+    if batch:
+        _bulk_insert(_entries(batch, [post]))
+        counts.follow_feeds_changed(batch)
+
+
+def fill_timeline(user_id, author_id, limit=None):
+    """
+    Переносим в ленту подписчика уже опубликованные посты автора,
+    начиная с новых; с limit — не больше limit постов. Возвращает
+    число перенесённых постов.
+    """
+    if is_pulled(author_id):
+        return 0
+    posts = Post.objects.filter(author_id=author_id).only(
+        'pk', 'author_id', 'pub_date').order_by('-pub_date', '-pk')
+    if limit is not None:
+        posts = posts[:limit]
+    batch = []
+    count = 0
+    for post in posts.iterator():
+        batch.append(post)
+        count += 1
+        if len(batch) >= settings.TIMELINE_BATCH_SIZE:
+            _bulk_insert(_entries([user_id], batch))
+            batch = []
+    if batch:
+        _bulk_insert(_entries([user_id], batch))
+    counts.follow_feeds_changed([user_id])
+    return count
+
+
+def follow_author(user_id, author_id):
+    """
+    Лента после подписки: свежие посты автора переносятся сразу, а если
+    их больше TIMELINE_FOLLOW_LIMIT, остальные дописываются в фоне.
+    """
+    limit = settings.TIMELINE_FOLLOW_LIMIT
+    if fill_timeline(user_id, author_id, limit) >= limit:
+        transaction.on_commit(
+            lambda: background.submit(fill_followed, user_id, author_id))
+
+
+def fill_followed(user_id, author_id):
+    """Дописывает ленту, если подписка ещё не отменена."""
+    if Follow.objects.filter(user_id=user_id, author_id=author_id).exists():
+        fill_timeline(user_id, author_id)
+
+
+def drop_author(user_id, author_id):
+    """Убираем из ленты подписчика посты автора после отписки."""
+    Timeline.objects.filter(user_id=user_id, author_id=author_id).delete()
+    counts.follow_feeds_changed([user_id])
+
+
+def rebuild_timelines(user_ids=None):
+    """Пересобираем ленты заново по данным Follow и Post."""
+    entries = Timeline.objects.all()
+    follows = Follow.objects.all()
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+        follows = follows.filter(user_id__in=user_ids)
+    counts.follow_feeds_changed(
+        set(entries.values_list('user_id', flat=True))
+        | set(follows.values_list('user_id', flat=True))
+    )
+    entries.delete()
+    count = 0
+    for user_id, author_id in follows.values_list(
+            'user_id', 'author_id').iterator():
+        fill_timeline(user_id, author_id)
+        count += 1
+    return count
+
+
+class TimelineFeed:
+    """
+    Лента подписок пользователя в виде последовательности постов.
+    Paginator берёт у неё count() и срезы, каждый срез читает
+    один диапазон индекса timeline_user_date_idx.
+    """
+
+    related = ('post__author', 'post__group')
+
+    def __init__(self, user, exclude_authors=()):
+        self.count_key = counts.count_key(counts.FOLLOW, user.pk)
+        self.exclude_authors = sorted(exclude_authors)
+        self.entries = Timeline.objects.filter(user=user)
+        if exclude_authors:
+            self.entries = self.entries.exclude(
+                author_id__in=exclude_authors)
+
+    def count(self):
+        # Число зависит от набора исключённых популярных авторов: когда
+        # автор переключается, старое значение просто не совпадёт.
+        return counts.cached_count(self.count_key, self.entries.count,
+                                   version=self.exclude_authors)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            rows = self.entries.select_related(*self.related)[key]
+            return [row.post for row in rows]
+        return self[key:key + 1][0]
+
+    def seek(self, key, backwards, limit):
+        entries = self.entries.select_related(*self.related)
+        rows = seek_queryset(entries, key, backwards, limit,
+                             id_field='post_id')
+        return [row.post for row in rows]
+
+
+class AuthorsFeed:
+    """Посты нескольких авторов, число постов берётся из их счётчиков."""
+
+    def __init__(self, author_ids):
+        self.author_ids = author_ids
+        self.posts = Post.objects.filter(
+            author_id__in=author_ids).select_related(
+                'author', 'group').order_by('-pub_date', '-pk')
+
+    def count(self):
+        return counts.authors_count(self.author_ids)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        return self.posts[key]
+
+    def seek(self, key, backwards, limit):
+        return seek_queryset(self.posts, key, backwards, limit)
+
+
+class MergedFeed:
+    """
+    Слияние нескольких лент, отсортированных по убыванию pub_date.
+    Для среза [start:stop] из каждого источника читается не больше
+    stop постов.
+    """
+
+    def __init__(self, *sources):
+        self.sources = sources
+
+    def count(self):
+        return sum(source.count() for source in self.sources)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        stop = key.stop if key.stop is not None else self.count()
+        merged = heapq.merge(
+            *(list(source[:stop]) for source in self.sources),
+            key=lambda post: (post.pub_date, post.pk),
+            reverse=True,
+        )
+        return list(merged)[key]
+
+    def seek(self, key, backwards, limit):
+        return merge_seek(self.sources, key, backwards, limit)
+
+
+def follow_feed(user):
+    """
+    Лента подписок: посты обычных авторов берутся из timeline,
+    посты популярных авторов читаются из Post при открытии ленты.
+    """
+    pulled = pulled_authors(user)
+    pushed = TimelineFeed(user, exclude_authors=pulled)
+    if not pulled:
+        return pushed
+    return MergedFeed(pushed, AuthorsFeed(pulled))
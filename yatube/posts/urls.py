@@ -1,26 +1,50 @@
 from django.urls import path
 
-from . import views
+from . import api, feeds, views
 
 app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('rss/', feeds.index_rss, name='index_rss'),
+    path('atom/', feeds.index_atom, name='index_atom'),
     path(
         'group/<slug:slug>/',
         views.group_posts,
         name='group_list'
     ),
+    path('group/<slug:slug>/rss/', feeds.group_rss, name='group_rss'),
+    path('group/<slug:slug>/atom/', feeds.group_atom, name='group_atom'),
     path(
         'profile/<str:username>/',
         views.profile,
         name='profile'
     ),
+    path(
+        'profile/<str:username>/rss/',
+        feeds.author_rss,
+        name='profile_rss'
+    ),
+    path(
+        'profile/<str:username>/atom/',
+        feeds.author_atom,
+        name='profile_atom'
+    ),
     path(
         'posts/<int:post_id>/',
         views.post_detail,
         name='post_detail'
     ),
+    path(
+        'updates/',
+        views.post_updates,
+        name='updates'
+    ),
+    path(
+        'search/',
+        views.post_search,
+        name='search'
+    ),
     path(
         'create/',
         views.post_create,
@@ -38,6 +62,11 @@ urlpatterns = [
         name='post_delete'
     ),
 
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     path(
         'posts/<int:post_id>/comment/',
         views.add_comment,
@@ -54,9 +83,33 @@ urlpatterns = [
         views.profile_follow,
         name='profile_follow'
     ),
+    path(
+        'profile/<str:username>/export/',
+        views.profile_export,
+        name='profile_export'
+    ),
     path(
         'profile/<str:username>/unfollow/',
         views.profile_unfollow,
         name='profile_unfollow'
     ),
+    path('api/v1/posts/', api.posts, name='api_posts'),
+    path('api/v1/posts/<int:post_id>/', api.post, name='api_post'),
+    path(
+        'api/v1/posts/<int:post_id>/comments/',
+        api.post_comments,
+        name='api_post_comments'
+    ),
+    path('api/v1/groups/', api.groups, name='api_groups'),
+    path(
+        'api/v1/groups/<slug:slug>/posts/',
+        api.group_posts,
+        name='api_group_posts'
+    ),
+    path(
+        'api/v1/authors/<str:username>/posts/',
+        api.author_posts,
+        name='api_author_posts'
+    ),
+    path('api/v1/follow/', api.follow, name='api_follow'),
 ]
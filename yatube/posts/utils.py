@@ -1,9 +1,206 @@
+import base64
+import binascii
+import heapq
+from datetime import datetime
+
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.functional import SimpleLazyObject, cached_property
+
+from .counts import count_for
+
+NEXT = 'n'
+PREVIOUS = 'p'
+LAST = 'l'
+
+
+def encode_key(direction, key=None):
+    """Непрозрачный токен курсора по ключу (дата, id)."""
+    raw = direction
+    if key is not None:
+        raw = f'{direction}|{key[0].isoformat()}|{key[1]}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def encode_cursor(direction, post=None):
+    """Токен курсора по ключу (pub_date, id) поста."""
+    if post is None:
+        return encode_key(direction)
+    return encode_key(direction, (post.pub_date, post.pk))
+
+
+def decode_cursor(token):
+    """Возвращает (direction, key) или None, если токен испорчен."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, *key = raw.decode().split('|')
+        if direction == LAST and not key:
+            return direction, None
+        pub_date, pk = key
+        if direction in (NEXT, PREVIOUS):
+            return direction, (datetime.fromisoformat(pub_date), int(pk))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        pass
+    return None
+
+
+def seek_queryset(queryset, key, backwards, limit,
+                  date_field='pub_date', id_field='pk'):
+    """
+    Keyset-выборка: limit строк строго после key (или до него при
+    backwards) в порядке (-date_field, -id_field). Результат всегда
+    отсортирован по убыванию.
+    """
+    if key is not None:
+        pub_date, pk = key
+        op = 'gt' if backwards else 'lt'
+        queryset = queryset.filter(
+            Q(**{f'{date_field}__{op}': pub_date})
+            | Q(**{date_field: pub_date, f'{id_field}__{op}': pk})
+        )
+    if backwards:
+        rows = list(queryset.order_by(date_field, id_field)[:limit])
+        rows.reverse()
+        return rows
+    return list(queryset.order_by(f'-{date_field}', f'-{id_field}')[:limit])
+
+
+def seek_after(queryset, token, limit, date_field, id_field='pk'):
+    """
+    Страница по возрастанию (date_field, id) после курсора token и
+    курсор следующей страницы ('' на последней). Без курсора —
+    первые limit строк.
+    """
+    cursor = decode_cursor(token or '')
+    key = cursor[1] if cursor is not None and cursor[0] == NEXT else None
+    rows = seek_queryset(queryset, key, True, limit + 1,
+                         date_field, id_field)
+    rows.reverse()
+    if len(rows) <= limit:
+        return rows, ''
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_key(NEXT, (getattr(last, date_field), last.pk))
+
+
+def seek(posts, key, backwards, limit):
+    """Keyset-выборка из QuerySet постов или ленты с методом seek()."""
+    if hasattr(posts, 'seek'):
+        return posts.seek(key, backwards, limit)
+    return seek_queryset(posts, key, backwards, limit)
+
+
+def merge_seek(sources, key, backwards, limit):
+    """Keyset-выборка из нескольких лент со слиянием по (pub_date, id)."""
+    merged = list(heapq.merge(
+        *(seek(source, key, backwards, limit) for source in sources),
+        key=lambda post: (post.pub_date, post.pk),
+        reverse=True,
+    ))
+    return merged[-limit:] if backwards else merged[:limit]
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator, который берёт число объектов из хранимого счётчика
+    known_count или из кэша по count_key.
+    """
+
+    def __init__(self, object_list, per_page, count_key=None,
+                 known_count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+        self.known_count = known_count
+
+    @cached_property
+    def count(self):
+        if self.known_count is not None:
+            return self.known_count
+        if self.count_key is None:
+            return Paginator.count.func(self)
+        return count_for(self.count_key, self.object_list)
+
+
+class CursorPage(Page):
+    """Страница, полученная по курсору: без номера и без OFFSET."""
+
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+
+def _cursor_page(posts, paginator, direction, key):
+    limit = paginator.per_page
+    backwards = direction in (PREVIOUS, LAST)
+    rows = seek(posts, key, backwards, limit + 1)
+    has_more = len(rows) > limit
+    if backwards:
+        rows = rows[-limit:]
+        return CursorPage(rows, paginator, direction == PREVIOUS, has_more)
+    return CursorPage(rows[:limit], paginator, has_more, True)
+
+
+def _lazy_cursor(page_obj, direction, index):
+    def token():
+        if not len(page_obj):
+            return ''
+        return encode_cursor(direction, page_obj[index])
+    return SimpleLazyObject(token)
+
+
+def page_window(page_obj, neighbours=None):
+    """
+    Номера страниц для навигации: первая, последняя и neighbours
+    соседей текущей; пропуски обозначены None. Длина списка не
+    зависит от числа страниц. Последняя страница в шаблоне открывается
+    по last_cursor, а не через OFFSET.
+    """
+    if neighbours is None:
+        neighbours = settings.PAGINATOR_NEIGHBOURS
+    last = page_obj.paginator.num_pages
+    current = page_obj.number
+    pages = {1, last}
+    pages.update(range(max(1, current - neighbours),
+                       min(last, current + neighbours) + 1))
+    window = []
+    for number in sorted(pages):
+        if window and number - window[-1] == 2:
+            window.append(number - 1)
+        elif window and number - window[-1] > 2:
+            window.append(None)
+        window.append(number)
+    return window
 
 
-def func_paginator(request, posts):
-    paginator = Paginator(posts, settings.POSTS_LIMIT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+def func_paginator(request, posts, count_key=None, count=None):
+    """
+    Страница ленты. Параметр ?page=N листает через OFFSET и годится
+    для первых страниц, ?cursor=... листает по ключу (pub_date, id)
+    без просмотра предыдущих строк. На обеих страницах доступны
+    next_cursor, previous_cursor и last_cursor для ссылок.
+    Число постов берётся из count, если оно уже известно по счётчику,
+    иначе из кэша по ключу count_key.
+    """
+    paginator = CachedCountPaginator(
+        posts, settings.POSTS_LIMIT, count_key, count)
+    cursor = decode_cursor(request.GET.get('cursor', ''))
+    if cursor is not None:
+        page_obj = _cursor_page(posts, paginator, *cursor)
+    else:
+        page_number = request.GET.get('page')
+        page_obj = paginator.get_page(page_number)
+        page_obj.page_window = page_window(page_obj)
+    page_obj.next_cursor = _lazy_cursor(page_obj, NEXT, -1)
+    page_obj.previous_cursor = _lazy_cursor(page_obj, PREVIOUS, 0)
+    page_obj.last_cursor = encode_cursor(LAST)
     return page_obj
@@ -1,14 +1,22 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 
+from . import export, notify, search
+from .cache import anonymous_page_cache
+from .counts import ALL, count_key, user_stats
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post
-from .utils import func_paginator
+from .models import Comment, Follow, Group, Post
+from .timeline import follow_feed
+from .utils import func_paginator, seek_after
 
 User = get_user_model()
 
 
+@anonymous_page_cache
 def index(request):
     """
      В переменную posts будет сохранена выборка из 10 объектов модели Post,
@@ -16,15 +24,20 @@ def index(request):
      (от больших значений к меньшим)
      В словаре context отправляем информацию в шаблон.
     """
-    posts = Post.objects.all()
-    page_obj = func_paginator(request, posts)
-    return render(request, 'posts/index.html', {'page_obj': page_obj})
+    posts = Post.objects.select_related('author', 'group')
+    page_obj = func_paginator(request, posts, count_key(ALL))
+    context = {
+        'page_obj': page_obj,
+        'cache_timeout': settings.FEED_CACHE_TIMEOUT,
+    }
+    return render(request, 'posts/index.html', context)
 
 
+@anonymous_page_cache
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.filter(group=group)
-    page_obj = func_paginator(request, posts)
+    posts = group.posts.select_related('author', 'group')
+    page_obj = func_paginator(request, posts, count=group.posts_count)
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -32,44 +45,86 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@anonymous_page_cache
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
-    posts = user.posts.all()
-    page_obj = func_paginator(request, posts)
+    user = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    stats = user_stats(user)
+    posts = user.posts.select_related('author', 'group')
+    page_obj = func_paginator(request, posts, count=stats.posts_count)
     following = True
-    follow_count: int = 0
     if request.user.is_authenticated:
-        following = user.follower.filter(
-            user=request.user,
-            author__username=username).exists()
-        follow_count = user.follower.filter(
-            user=request.user,
-            author__username=username).count
+        following = Follow.objects.filter(
+            user=request.user, author=user).exists()
 
     context = {
         'users': user,
+        'stats': stats,
         'page_obj': page_obj,
         'following': following,
-        'follow_count': follow_count,
+        'follow_count': stats.followers_count,
 
     }
     return render(request, 'posts/profile.html', context)
 
 
+@anonymous_page_cache
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id)
     author = post.author
     form = CommentForm(request.POST or None)
-    comments = post.comments.all()
+    comments, comments_cursor = comment_page(
+        post.pk, request.GET.get('comments'))
     context = {
         'posted': post,
         'form': form,
         'author': author,
+        'author_posts_count': user_stats(author).posts_count,
         'comments': comments,
+        'comments_cursor': comments_cursor,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def comment_page(post_id, cursor):
+    """
+    COMMENTS_LIMIT комментариев поста после курсора по (created, id)
+    и курсор следующей порции. Строки читаются по индексу
+    comment_post_created_idx, число комментариев — из comments_count.
+    """
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author')
+    return seek_after(comments, cursor, settings.COMMENTS_LIMIT,
+                      date_field='created')
+
+
+@anonymous_page_cache
+def post_comments(request, post_id):
+    """Следующая порция комментариев для кнопки «Показать ещё»."""
+    comments, comments_cursor = comment_page(
+        post_id, request.GET.get('cursor'))
+    context = {
+        'post_id': post_id,
+        'comments': comments,
+        'comments_cursor': comments_cursor,
+    }
+    return render(request, 'includes/comments_list.html', context)
+
+
+@anonymous_page_cache
+def post_search(request):
+    """Поиск постов по тексту, лучшие совпадения первыми."""
+    query = request.GET.get('q', '').strip()
+    key = search.decode_cursor(request.GET.get('cursor', ''))
+    posts, next_cursor = search.search_posts(query, key)
+    return render(request, 'posts/search.html', {
+        'query': query,
+        'posts': posts,
+        'next_cursor': next_cursor,
+    })
+
+
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
@@ -134,7 +189,7 @@ def post_delete(request, post_id):
 
 @login_required
 def follow_index(request):
-    list_of_posts = Post.objects.filter(author__following__user=request.user)
+    list_of_posts = follow_feed(request.user)
     page_obj = func_paginator(request, list_of_posts)
     return render(request, 'posts/follow.html', {'page_obj': page_obj})
 
@@ -153,3 +208,65 @@ def profile_follow(request, username):
 def profile_unfollow(request, username):
     request.user.follower.get(author__username=username).delete()
     return redirect('posts:follow_index')
+
+
+@login_required
+def profile_export(request, username):
+    """Выгрузка данных пользователя потоком: jsonl или zip (?format=)."""
+    user = get_object_or_404(User, username=username)
+    if request.user != user and not request.user.is_staff:
+        raise PermissionDenied
+    export_format = request.GET.get('format', 'jsonl')
+    if export_format not in export.FORMATS:
+        raise Http404
+    chunks, content_type = export.FORMATS[export_format]
+    response = StreamingHttpResponse(chunks(user), content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="{user.username}.{export_format}"')
+    return response
+
+
+def _updates_scope(request):
+    if request.GET.get('group'):
+        group = get_object_or_404(Group, slug=request.GET['group'])
+        return notify.group_scope(group.pk)
+    if request.GET.get('feed') == 'follow':
+        if not request.user.is_authenticated:
+            return None
+        return notify.follow_scope(request.user.pk)
+    return notify.ALL
+
+
+def _int(value, default=0):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def post_updates(request):
+    """
+    Сколько постов новее ?since= (id последнего увиденного поста) во
+    всей ленте, в группе (?group=) или в подписках (?feed=follow).
+    С Accept: text/event-stream отвечает потоком событий, иначе
+    long-poll: ждёт до ?wait= секунд, пока новых постов нет.
+    """
+    scope = _updates_scope(request)
+    if scope is None:
+        return JsonResponse({'error': 'Нужна авторизация'}, status=401)
+    since = _int(request.META.get('HTTP_LAST_EVENT_ID',
+                                  request.GET.get('since')))
+    if 'text/event-stream' in request.META.get('HTTP_ACCEPT', ''):
+        response = StreamingHttpResponse(
+            notify.event_stream(scope, since),
+            content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    count, latest = notify.notifier.state(scope, since)
+    wait = min(_int(request.GET.get('wait')),
+               settings.NOTIFY_LONG_POLL_TIMEOUT)
+    if not count and wait > 0:
+        notify.notifier.wait(scope, max(since, latest), wait)
+        count, latest = notify.notifier.state(scope, since)
+    return JsonResponse({'count': count, 'latest': latest})
@@ -1,4 +1,8 @@
+import atexit
 import os
+import shutil
+import sys
+import tempfile
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -106,17 +110,108 @@ STATICFILES_DIRS = [
 
 POSTS_LIMIT = 10
 
+SEARCH_LIMIT = 10
+
+# Комментариев на странице поста и в каждой следующей порции.
+COMMENTS_LIMIT = 20
+
+# Уведомления о новых постах: сколько последних id области держать
+# в памяти, как часто сверяться с кэшем и сколько ждать ответа.
+NOTIFY_RECENT = 200
+NOTIFY_POLL_INTERVAL = 5
+NOTIFY_LONG_POLL_TIMEOUT = 25
+NOTIFY_HEARTBEAT = 15
+NOTIFY_STREAM_DURATION = 5 * 60
+NOTIFY_RETRY_MS = 5000
+
+# Наибольший размер страницы API (?limit=).
+API_MAX_LIMIT = 100
+
+# Сколько последних постов отдают RSS и Atom.
+FEED_ITEMS = 20
+
+# Сколько соседних номеров страниц показывать в навигации.
+PAGINATOR_NEIGHBOURS = 2
+
+# Число постов в лентах хранится в кэше и поддерживается сигналами.
+POSTS_COUNT_TIMEOUT = 60 * 60
+
+# Выше этого порога число всех постов оценивается по максимальному id.
+POSTS_COUNT_ESTIMATE_THRESHOLD = 100000
+
+TIMELINE_BATCH_SIZE = 500
+# Столько свежих постов автора попадает в ленту прямо при подписке,
+# остальные дописываются в фоне.
+TIMELINE_FOLLOW_LIMIT = 200
+
+# Посты авторов с большим числом подписчиков не раскладываются по лентам,
+# а читаются при открытии ленты. Обратно к раскладке автор переходит,
+# только опустившись до FEED_PUSH_THRESHOLD: иначе подписка и отписка
+# на границе каждый раз переключали бы его туда и обратно.
+FEED_PULL_THRESHOLD = 1000
+FEED_PUSH_THRESHOLD = 900
+
+# Загруженные картинки уменьшаются до этого размера и пересохраняются.
+IMAGE_MAX_SIZE = (2560, 2560)
+IMAGE_QUALITY = 85
+
+# Процессов для фоновых задач (миниатюры, раскладка лент);
+# 0 — выполнять сразу в запросе.
+BACKGROUND_WORKERS = 2
+
+# По столько строк выгрузка читает из базы за раз.
+EXPORT_CHUNK_SIZE = 2000
+
 LOGIN_URL = 'users:login'
 
 LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'posts:index'
 
+CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
+
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
+# Фрагменты лент сбрасываются сменой версии при изменении данных,
+# поэтому могут храниться долго.
+FEED_CACHE_TIMEOUT = 60 * 60
+
+# Сколько секунд устаревший фрагмент ещё отдаётся, пока его пересчитывают,
+# срок блокировки пересчёта, сколько ждать чужого пересчёта, когда
+# отдать нечего, и коэффициент раннего обновления.
+FEED_CACHE_STALE_TIMEOUT = 60 * 10
+FEED_CACHE_LOCK_TIMEOUT = 30
+FEED_CACHE_LOCK_WAIT = 2
+FEED_CACHE_EARLY_REFRESH = 1.0
+# Как часто процесс сбрасывает в кэш счётчики попаданий фрагментов.
+FEED_CACHE_STATS_INTERVAL = 10
+
+# Страницы для гостей кэшируются целиком до смены версии содержимого.
+PAGE_CACHE_TIMEOUT = 60 * 60
+
+# Карточки постов кэшируются по версии поста и общие для всех лент.
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Общий для всех процессов сервера кэш в файле SQLite.
+# Тесты вызывают cache.clear(), поэтому работают со своим файлом кэша
+# во временном каталоге, а не с общим файлом запущенного сервера.
+# Путь передаётся через окружение и процессам фоновых задач.
+CACHE_LOCATION = os.environ.get('YATUBE_CACHE_LOCATION')
+if CACHE_LOCATION is None:
+    CACHE_LOCATION = os.path.join(BASE_DIR, 'cache', 'default.sqlite3')
+    if 'test' in sys.argv[1:2] or 'pytest' in sys.modules:
+        _test_cache_dir = tempfile.mkdtemp(prefix='yatube-cache-')
+        atexit.register(shutil.rmtree, _test_cache_dir, True)
+        CACHE_LOCATION = os.path.join(_test_cache_dir, 'default.sqlite3')
+        os.environ['YATUBE_CACHE_LOCATION'] = CACHE_LOCATION
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': CACHE_LOCATION,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
     }
 }
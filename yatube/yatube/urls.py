@@ -14,7 +14,7 @@ urlpatterns = [
 ]
 
 handler404 = 'core.views.Not_found_404'
-handler403 = 'core.views.csrf_failure'
+handler403 = 'core.views.crfs_403'
 handler500 = 'core.views.server_error_500'
 
 if settings.DEBUG: